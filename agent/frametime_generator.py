@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Synthetic frame-time source for testing the agent's FPS statistics without a game.
+
+Sends frame times (milliseconds, one per line) to the agent's UDP frame-time
+port in small batches, paced in real time. Occasional stutters make the
+1% and 0.1% lows differ visibly from the average.
+
+    python frametime_generator.py --fps 144 --jitter 0.1 --stutter-rate 0.005
+"""
+
+import argparse
+import random
+import socket
+import time
+
+from wfps_agent import FRAMETIME_PORT
+
+
+def frame_times(fps: float, jitter: float, stutter_rate: float, stutter_ms: float):
+    """Endless frame times around 1000/fps ms, with random stutter spikes"""
+    base = 1000 / fps
+    while True:
+        frame = random.gauss(base, base * jitter)
+        if random.random() < stutter_rate:
+            frame += random.uniform(stutter_ms / 2, stutter_ms)
+        yield max(frame, 0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=FRAMETIME_PORT)
+    parser.add_argument("--fps", type=float, default=144.0)
+    parser.add_argument("--jitter", type=float, default=0.1, help="frame time standard deviation, as a fraction")
+    parser.add_argument("--stutter-rate", type=float, default=0.005, help="fraction of frames that stutter")
+    parser.add_argument("--stutter-ms", type=float, default=50.0, help="largest extra delay of a stutter")
+    parser.add_argument("--batch", type=int, default=16, help="frames per datagram")
+    parser.add_argument("--duration", type=float, default=0, help="seconds to run, 0 for forever")
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    target = ("127.0.0.1", args.port)
+    started = time.monotonic()
+    elapsed_ms = 0.0
+    batch = []
+    print(f"Sending ~{args.fps:g} FPS frame times to udp://{target[0]}:{target[1]}")
+
+    for frame in frame_times(args.fps, args.jitter, args.stutter_rate, args.stutter_ms):
+        batch.append(f"{frame:.3f}")
+        elapsed_ms += frame
+        if len(batch) < args.batch:
+            continue
+        # Send each batch when its frames would have finished rendering
+        delay = started + elapsed_ms / 1000 - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        sock.sendto("\n".join(batch).encode("ascii"), target)
+        batch = []
+        if args.duration and elapsed_ms / 1000 >= args.duration:
+            break
+
+
+if __name__ == "__main__":
+    main()
@@ -9,16 +9,656 @@ import os
 import sys
 import time
 import platform
+import math
+import random
+import re
+import socket
+import struct
 import subprocess
+import sqlite3
+import gzip
 import json
+import queue
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import deque
+from contextlib import contextmanager
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 
 # Configuration
 API_URL = os.environ.get('WFPS_API_URL', "https://fps-enhancer-13.preview.emergentagent.com/api")
 AGENT_ID = f"agent_{platform.node()}_{int(time.time())}"
-POLL_INTERVAL = 5  # seconds
+# Seconds between cycles; the active intervals apply while boosting or a game is running
+TELEMETRY_INTERVAL_IDLE = 10
+TELEMETRY_INTERVAL_ACTIVE = 2
+COMMAND_INTERVAL_IDLE = 15  # only polled when the long-poll channel is down
+COMMAND_INTERVAL_ACTIVE = 3
+SCHEDULE_JITTER = 0.2  # each interval is randomly stretched or shrunk by up to this fraction
+BREAKER_THRESHOLD = 3  # consecutive API failures before backing off
+BREAKER_BACKOFF = 5  # seconds, doubled on each further failure
+BREAKER_BACKOFF_MAX = 300
+TELEMETRY_BATCH_SIZE = 6  # flush once this many samples are buffered
+TELEMETRY_FLUSH_INTERVAL = 30  # seconds, flush older buffers regardless of size
+DELTA_FLUSH_INTERVAL = 10  # seconds, the shorter limit in delta mode, where samples are rarer
+TELEMETRY_BUFFER_MAX = 500  # oldest samples are dropped past this while offline without a spool
+SPOOL_PATH = os.environ.get('WFPS_SPOOL_PATH', os.path.join(os.path.expanduser("~"), ".wfps", "spool.db"))
+SPOOL_MAX_BYTES = 20 * 1024 * 1024  # oldest spooled items are evicted past this
+SPOOL_REPLAY_BATCH = 500  # items per replay request (the backend's batch limit)
+SPOOL_REPLAY_BATCHES = 2  # replay requests per cycle, so a reconnecting fleet ramps up gradually
+# Original priority/affinity of boosted processes, kept on disk so a crashed agent can undo them
+JOURNAL_PATH = os.environ.get('WFPS_JOURNAL_PATH', os.path.join(os.path.expanduser("~"), ".wfps", "boost_journal.json"))
+COMMAND_WAIT_TIMEOUT = 25  # seconds the backend may hold a long-poll open
+COMMAND_WAIT_RETRY = 30  # seconds before retrying the push channel after it drops
+SNAPSHOT_MAX_AGE = 1.0  # seconds a process snapshot is reused within a cycle (without the watcher)
+PROCESS_WATCH_INTERVAL = 0.5  # seconds between process watcher checks for started/exited processes
+SAMPLE_INTERVAL = 1.0  # seconds between background CPU/RAM samples
+SAMPLE_HISTORY = 120  # samples kept in the sampler ring buffer
+TEMPERATURE_INTERVAL = 10  # seconds between temperature reads (wmic is slow)
+HEAVY_PROCESS_CPU = 5.0  # percent of one core; busier processes are moved off the game cores
+HEAVY_SAMPLE_WINDOW = 0.5  # seconds over which process CPU usage is measured
+HTTP_RETRIES = 3  # retries for connection errors and 502/503/504 responses
+HTTP_BACKOFF = 0.5  # seconds, doubled on each retry
+GZIP_MIN_BYTES = 1024  # request bodies at least this large are gzip-compressed
+REPORT_MODE = "delta"  # "delta" sends a sample only when something changed, "full" sends every one
+HEARTBEAT_INTERVAL = 60  # seconds, in delta mode a sample is sent at least this often
+# Smallest change per metric that counts as a change in delta mode
+DELTA_THRESHOLDS = {
+    "cpu_usage": 5.0,  # percentage points
+    "ram_usage": 2.0,  # percentage points
+    "ram_available": 0.25,  # GB
+    "temperature": 2.0,  # degrees
+    "fps": 5,
+    "fps_low_1": 5.0,
+}
+# Frame times in milliseconds are received as text over UDP from an overlay or capture tool
+# (see frametime_generator.py); set the port to 0 to disable
+FRAMETIME_PORT = int(os.environ.get('WFPS_FRAMETIME_PORT', '48765'))
+FRAMETIME_BUCKET_RATIO = 1.01  # frame times are bucketed on a log scale with 1% resolution
+
+# Compact telemetry frames (must match the backend's decoder): header with
+# magic, schema version, sample count and agent_id length, the agent_id once,
+# then a fixed record per sample plus the active game name when flagged.
+# Version 2 adds the heartbeat interval right after the header; version 3
+# adds the FPS lows after the record when their flag is set, and version 4
+# the agent's stage timings after those.
+TELEMETRY_BINARY_TYPE = "application/x-wfps-telemetry"
+BINARY_MAGIC = b"WT"
+BINARY_VERSION = 4
+BINARY_HEADER = struct.Struct("<2sBHH")
+BINARY_HEADER_V2 = struct.Struct("<H")  # heartbeat interval in seconds, 0 when not set
+BINARY_SAMPLE_V1 = struct.Struct("<dfffBfH")  # timestamp, cpu, ram, ram available, flags, temperature, fps
+FLAG_TEMPERATURE = 1
+FLAG_FPS = 2
+FLAG_GAME = 4
+FLAG_FPS_LOWS = 8
+BINARY_FPS_LOWS = struct.Struct("<ff")  # 1% low, 0.1% low
+FLAG_TIMINGS = 16
+AGENT_STAGES = ("sampling", "process_scan", "network", "commands")
+BINARY_TIMINGS = struct.Struct("<ffff")  # milliseconds per cycle, in AGENT_STAGES order
+
+COMMON_GAMES = (
+    "csgo.exe", "valorant.exe", "league of legends.exe", "fortnite.exe",
+    "apex_legends.exe", "cod.exe", "pubg.exe", "overwatch.exe",
+    "minecraft.exe", "dota2.exe", "gta5.exe", "rocketleague.exe"
+)
+# Process names are matched by substring, so all games are checked in one regex pass
+GAME_PATTERN = re.compile("|".join(re.escape(game) for game in COMMON_GAMES))
+
+# Protected processes that should never be killed (substring match)
+PROTECTED_PROCESSES = (
+    'system', 'registry', 'smss.exe', 'csrss.exe', 'wininit.exe',
+    'services.exe', 'lsass.exe', 'svchost.exe', 'explorer.exe',
+    'dwm.exe', 'taskmgr.exe', 'python.exe', 'wfps_agent.exe'
+)
+PROTECTED_PATTERN = re.compile("|".join(re.escape(p) for p in PROTECTED_PROCESSES))
+BACKGROUND_APPS = frozenset(['chrome.exe', 'discord.exe', 'spotify.exe', 'slack.exe'])
+
+
+def create_session(headers: Dict[str, str], retries: int = HTTP_RETRIES) -> requests.Session:
+    """HTTP session with keep-alive connection pooling and retries with backoff"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        # POSTs are only retried when the connection failed before anything was sent
+        allowed_methods=frozenset(["GET", "PUT"]),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(headers)
+    return session
+
+
+def encode_binary_telemetry(samples: List[Dict]) -> bytes:
+    """Pack telemetry samples from a single agent into a binary frame"""
+    agent_id = samples[0]["agent_id"].encode('utf-8')
+    heartbeat_interval = samples[-1].get("heartbeat_interval") or 0
+    parts = [
+        BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(samples), len(agent_id)),
+        BINARY_HEADER_V2.pack(min(heartbeat_interval, 0xFFFF)),
+        agent_id,
+    ]
+    for sample in samples:
+        if sample["agent_id"].encode('utf-8') != agent_id:
+            raise ValueError("All samples in a frame must come from the same agent")
+        flags = 0
+        if sample.get("temperature") is not None:
+            flags |= FLAG_TEMPERATURE
+        if sample.get("fps") is not None:
+            flags |= FLAG_FPS
+        if sample.get("fps_low_1") is not None:
+            flags |= FLAG_FPS_LOWS
+        timings = sample.get("agent_timings")
+        if timings:
+            flags |= FLAG_TIMINGS
+        game = (sample.get("active_game") or "").encode('utf-8')[:255]
+        if game:
+            flags |= FLAG_GAME
+        parts.append(BINARY_SAMPLE_V1.pack(
+            datetime.fromisoformat(sample["timestamp"]).timestamp(),
+            sample["cpu_usage"],
+            sample["ram_usage"],
+            sample["ram_available"],
+            flags,
+            sample.get("temperature") or 0.0,
+            min(sample.get("fps") or 0, 0xFFFF)
+        ))
+        if flags & FLAG_FPS_LOWS:
+            parts.append(BINARY_FPS_LOWS.pack(sample["fps_low_1"], sample.get("fps_low_01") or 0.0))
+        if flags & FLAG_TIMINGS:
+            parts.append(BINARY_TIMINGS.pack(*(timings.get(f"{stage}_ms", 0.0) for stage in AGENT_STAGES)))
+        if game:
+            parts.append(bytes([len(game)]) + game)
+    return b"".join(parts)
+
+
+def jittered(interval: float) -> float:
+    """Interval randomly spread by SCHEDULE_JITTER so agents started together drift apart"""
+    return interval * random.uniform(1 - SCHEDULE_JITTER, 1 + SCHEDULE_JITTER)
+
+
+def metric_changed(previous, current, threshold: float) -> bool:
+    """Whether a metric moved by at least threshold, or appeared/disappeared"""
+    if previous is None or current is None:
+        return (previous is None) != (current is None)
+    return abs(current - previous) >= threshold
+
+
+def read_temperature() -> Optional[float]:
+    """Read system temperature in Celsius (Windows only)"""
+    if platform.system() != "Windows":
+        return None
+    try:
+        # Using wmic for Windows temperature
+        result = subprocess.run(
+            ['wmic', 'path', 'win32_perfformatteddata_counters_thermalzoneinformation', 'get', 'temperature'],
+            capture_output=True,
+            text=True,
+            timeout=2
+        )
+        temp_str = result.stdout.strip().split('\n')[-1].strip()
+        if temp_str.isdigit():
+            return (int(temp_str) - 2732) / 10  # Convert to Celsius
+    except:
+        pass
+    return None
+
+
+class StageTimer:
+    """Time the agent spends in each stage of its cycle, from any thread"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = dict.fromkeys(AGENT_STAGES, 0.0)
+        self.cycles = 0
+    
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.totals[name] += elapsed
+    
+    def cycle(self):
+        with self.lock:
+            self.cycles += 1
+    
+    def report(self) -> Dict[str, float]:
+        """Milliseconds per cycle spent in each stage since the previous report"""
+        with self.lock:
+            cycles = max(self.cycles, 1)
+            timings = {f"{stage}_ms": round(total * 1000 / cycles, 3) for stage, total in self.totals.items()}
+            self.totals = dict.fromkeys(AGENT_STAGES, 0.0)
+            self.cycles = 0
+        return timings
+
+
+class SystemSampler(threading.Thread):
+    """Background thread sampling CPU, RAM and temperature into a ring buffer"""
+    
+    def __init__(self, interval: float = SAMPLE_INTERVAL, history: int = SAMPLE_HISTORY,
+                 timer: Optional[StageTimer] = None):
+        super().__init__(name="wfps-sampler", daemon=True)
+        self.interval = interval
+        self.timer = timer or StageTimer()
+        self.samples: "deque[Dict]" = deque(maxlen=history)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.temperature: Optional[float] = None
+        self.temperature_read = 0.0
+        # cpu_percent(None) reports usage since the previous call, so prime it now
+        psutil.cpu_percent(interval=None)
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            with self.timer.stage("sampling"):
+                self.sample()
+    
+    def stop(self):
+        self.stopped.set()
+    
+    def sample(self) -> Dict:
+        """Take one sample without blocking and append it to the buffer"""
+        now = time.monotonic()
+        if now - self.temperature_read >= TEMPERATURE_INTERVAL:
+            self.temperature = read_temperature()
+            self.temperature_read = now
+        
+        memory = psutil.virtual_memory()
+        sample = {
+            "time": now,
+            "cpu_usage": psutil.cpu_percent(interval=None),
+            "ram_usage": memory.percent,
+            "ram_available": memory.available / (1024**3),  # GB
+            "temperature": self.temperature,
+        }
+        with self.lock:
+            self.samples.append(sample)
+        return sample
+    
+    def latest(self) -> Optional[Dict]:
+        with self.lock:
+            return self.samples[-1] if self.samples else None
+    
+    def summary(self, window: float) -> Optional[Dict]:
+        """Average CPU over the last `window` seconds plus the latest RAM and temperature"""
+        cutoff = time.monotonic() - window
+        with self.lock:
+            recent = [s for s in self.samples if s["time"] >= cutoff]
+        if not recent:
+            return None
+        
+        latest = recent[-1]
+        return {
+            "cpu_usage": sum(s["cpu_usage"] for s in recent) / len(recent),
+            "ram_usage": latest["ram_usage"],
+            "ram_available": latest["ram_available"],
+            "temperature": latest["temperature"],
+        }
+
+
+class FrameTimeStats:
+    """Streaming average FPS and 1%/0.1% lows over frame times, in constant memory"""
+    
+    def __init__(self, ratio: float = FRAMETIME_BUCKET_RATIO):
+        self.log_ratio = math.log(ratio)
+        self.reset()
+    
+    def reset(self):
+        self.frames = 0
+        self.total_ms = 0.0
+        # Bucket index -> frame count; ~1000 buckets cover 0.1 ms to 2 s at 1% resolution
+        self.buckets: Dict[int, int] = {}
+    
+    def add(self, frame_ms: float):
+        if not frame_ms > 0:  # also rejects NaN
+            return
+        # Clamping keeps the bucket count bounded whatever the input
+        frame_ms = min(max(frame_ms, 0.1), 2000.0)
+        self.frames += 1
+        self.total_ms += frame_ms
+        bucket = round(math.log(frame_ms) / self.log_ratio)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+    
+    def slowest_mean_ms(self, fraction: float) -> float:
+        """Mean frame time of the slowest `fraction` of frames (at least one)"""
+        wanted = max(1, math.ceil(self.frames * fraction))
+        remaining = wanted
+        total = 0.0
+        for bucket in sorted(self.buckets, reverse=True):
+            taken = min(self.buckets[bucket], remaining)
+            total += taken * math.exp(bucket * self.log_ratio)
+            remaining -= taken
+            if not remaining:
+                break
+        return total / wanted
+    
+    def summary(self) -> Optional[Dict]:
+        if not self.frames:
+            return None
+        return {
+            "fps": round(1000 * self.frames / self.total_ms),
+            # The 1% low is the average frame rate of the slowest 1% of frames
+            "fps_low_1": round(1000 / self.slowest_mean_ms(0.01), 1),
+            "fps_low_01": round(1000 / self.slowest_mean_ms(0.001), 1),
+        }
+
+
+class FrameTimeReceiver(threading.Thread):
+    """Reads frame times (milliseconds, whitespace-separated text) from a local UDP port"""
+    
+    def __init__(self, port: int = FRAMETIME_PORT):
+        super().__init__(name="wfps-frametimes", daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", port))
+        self.stats = FrameTimeStats()
+        self.lock = threading.Lock()
+    
+    def run(self):
+        while True:
+            data = self.sock.recv(65535)
+            values = []
+            for token in data.split():
+                try:
+                    values.append(float(token))
+                except ValueError:
+                    continue
+            with self.lock:
+                for value in values:
+                    self.stats.add(value)
+    
+    def collect(self) -> Optional[Dict]:
+        """FPS statistics for the frames received since the previous call"""
+        with self.lock:
+            summary = self.stats.summary()
+            self.stats.reset()
+        return summary
+
+
+class ProcessSnapshot:
+    """A single scan of the process table, indexed by lowercased process name"""
+    
+    def __init__(self, by_name: Optional[Dict[str, List[psutil.Process]]] = None):
+        self.created = time.monotonic()
+        if by_name is not None:
+            self.by_name = by_name
+            return
+        self.by_name = {}
+        for proc in psutil.process_iter(['name']):
+            name = proc.info['name']
+            if name:
+                self.by_name.setdefault(name.lower(), []).append(proc)
+    
+    def find(self, name: str) -> List[psutil.Process]:
+        """Processes whose name matches exactly (case-insensitive)"""
+        return self.by_name.get(name.lower(), [])
+    
+    def search(self, pattern: "re.Pattern") -> Optional[psutil.Process]:
+        """First process whose name contains a match for the pattern"""
+        for name, procs in self.by_name.items():
+            if pattern.search(name):
+                return procs[0]
+        return None
+
+
+class ProcessWatcher(threading.Thread):
+    """Keeps a name -> process index current by diffing the pid list instead of rescanning"""
+    
+    def __init__(self, interval: float = PROCESS_WATCH_INTERVAL, timer: Optional[StageTimer] = None):
+        super().__init__(name="wfps-process-watcher", daemon=True)
+        self.interval = interval
+        self.timer = timer or StageTimer()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.procs: Dict[int, psutil.Process] = {}
+        self.by_name: Dict[str, List[psutil.Process]] = {}
+        self.listeners = []  # called with the list of newly started processes
+        self.recent: List[psutil.Process] = []  # started in the previous poll
+        self.poll()
+    
+    @staticmethod
+    def list_pids() -> set:
+        # Listing /proc is much cheaper than psutil.pids() plus a per-process lookup
+        if sys.platform.startswith("linux"):
+            return {int(entry) for entry in os.listdir("/proc") if entry.isdigit()}
+        return set(psutil.pids())
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            with self.timer.stage("process_scan"):
+                started = self.poll()
+            if started:
+                for listener in self.listeners:
+                    listener(started)
+    
+    def stop(self):
+        self.stopped.set()
+    
+    def poll(self) -> List[psutil.Process]:
+        """Update the index with processes started and exited since the last poll"""
+        pids = self.list_pids()
+        with self.lock:
+            known = set(self.procs)
+        
+        started = []
+        for pid in pids - known:
+            try:
+                proc = psutil.Process(pid)
+                # Same shape as process_iter(['name']) so callers can read proc.info['name']
+                proc.info = {'name': proc.name()}
+            except psutil.Error:
+                continue
+            if proc.info['name']:
+                started.append(proc)
+        
+        # A process caught between fork and exec still has its parent's name; look once more
+        renamed = []
+        for proc in self.recent:
+            try:
+                name = proc.name()
+            except psutil.Error:
+                continue
+            if name and name != proc.info['name']:
+                renamed.append((proc, proc.info['name']))
+                proc.info = {'name': name}
+        self.recent = started
+        
+        with self.lock:
+            for proc, old_name in renamed:
+                self.unindex(proc.pid, old_name)
+                self.by_name.setdefault(proc.info['name'].lower(), []).append(proc)
+            for pid in known - pids:
+                proc = self.procs.pop(pid)
+                self.unindex(pid, proc.info['name'])
+            for proc in started:
+                self.procs[proc.pid] = proc
+                self.by_name.setdefault(proc.info['name'].lower(), []).append(proc)
+        return started + [proc for proc, _ in renamed]
+    
+    def unindex(self, pid: int, name: str):
+        name = name.lower()
+        remaining = [p for p in self.by_name.get(name, []) if p.pid != pid]
+        if remaining:
+            self.by_name[name] = remaining
+        else:
+            self.by_name.pop(name, None)
+    
+    def snapshot(self) -> ProcessSnapshot:
+        """The current index as a ProcessSnapshot, without touching the process table"""
+        with self.lock:
+            return ProcessSnapshot({name: list(procs) for name, procs in self.by_name.items()})
+
+
+class OfflineSpool:
+    """On-disk queue of telemetry samples and command results the backend hasn't accepted yet"""
+    
+    def __init__(self, path: str, max_bytes: int = SPOOL_MAX_BYTES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, "
+            "agent_id TEXT, payload TEXT NOT NULL, size INTEGER NOT NULL)"
+        )
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM spool").fetchone()[0]
+    
+    def __len__(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+    
+    def put(self, kind: str, items: List[Dict]):
+        """Append items, then evict the oldest ones until the spool fits max_bytes"""
+        rows = []
+        for item in items:
+            payload = json.dumps(item, separators=(',', ':'))
+            rows.append((kind, item.get("agent_id"), payload, len(payload)))
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.executemany("INSERT INTO spool (kind, agent_id, payload, size) VALUES (?, ?, ?, ?)", rows)
+            self.size += sum(row[3] for row in rows)
+            evicted = 0
+            while self.size > self.max_bytes:
+                oldest = self.db.execute("SELECT id, size FROM spool ORDER BY id LIMIT 100").fetchall()
+                if not oldest:
+                    break
+                dropped = []
+                for row_id, size in oldest:
+                    if self.size <= self.max_bytes:
+                        break
+                    dropped.append((row_id,))
+                    self.size -= size
+                self.db.executemany("DELETE FROM spool WHERE id = ?", dropped)
+                evicted += len(dropped)
+            self.db.execute("COMMIT")
+        if evicted:
+            print(f"Offline spool full, dropped {evicted} oldest items")
+    
+    def peek(self, kind: str, limit: int) -> List[tuple]:
+        """Oldest (id, agent_id, item) rows of a kind, without removing them"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, agent_id, payload FROM spool WHERE kind = ? ORDER BY id LIMIT ?", (kind, limit)
+            ).fetchall()
+        return [(row_id, agent_id, json.loads(payload)) for row_id, agent_id, payload in rows]
+    
+    def remove(self, ids: List[int]):
+        with self.lock:
+            self.db.execute("BEGIN")
+            for row_id in ids:
+                row = self.db.execute("SELECT size FROM spool WHERE id = ?", (row_id,)).fetchone()
+                if row:
+                    self.size -= row[0]
+                    self.db.execute("DELETE FROM spool WHERE id = ?", (row_id,))
+            self.db.execute("COMMIT")
+
+
+class CircuitBreaker:
+    """Stops API calls after repeated failures, retrying with exponential backoff"""
+    
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, backoff: float = BREAKER_BACKOFF,
+                 backoff_max: float = BREAKER_BACKOFF_MAX):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.failures = 0
+        self.open_until = 0.0
+    
+    def allow(self) -> bool:
+        """Whether API calls may be made now (closed, or open but due for a trial call)"""
+        return time.monotonic() >= self.open_until
+    
+    def record_success(self):
+        if self.failures >= self.threshold:
+            print("Backend reachable again")
+        self.failures = 0
+        self.open_until = 0.0
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            delay = min(self.backoff * 2 ** (self.failures - self.threshold), self.backoff_max)
+            self.open_until = time.monotonic() + jittered(delay)
+            print(f"Backend unavailable, pausing API calls for {delay:.0f}s")
+
+
+class BoostJournal:
+    """Original nice value and CPU affinity of every process a boost changed"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        # "pid:create_time" -> {"pid", "create_time", "name", "nice"?, "affinity"?}
+        self.entries: Dict[str, Dict] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable boost journal {path}: {e}")
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def record(self, proc: psutil.Process, attribute: str, original):
+        """Remember a value before it is first changed; later changes keep the original"""
+        try:
+            create_time = proc.create_time()
+        except psutil.Error:
+            return
+        entry = self.entries.setdefault(f"{proc.pid}:{create_time}", {
+            "pid": proc.pid, "create_time": create_time, "name": getattr(proc, 'info', {}).get('name'),
+        })
+        entry.setdefault(attribute, original)
+    
+    def save(self):
+        if not self.path:
+            return
+        try:
+            if not self.entries:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Write then rename, so a crash mid-write never leaves a truncated journal
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding='utf-8') as f:
+                json.dump(self.entries, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Failed to save boost journal: {e}")
+    
+    def restore(self) -> int:
+        """Put every journaled process back as it was, then clear the journal"""
+        restored = 0
+        for entry in self.entries.values():
+            try:
+                proc = psutil.Process(entry["pid"])
+                # Same pid but a different start time means the process is gone and the pid reused
+                if proc.create_time() != entry["create_time"]:
+                    continue
+                if "nice" in entry:
+                    proc.nice(entry["nice"])
+                if "affinity" in entry:
+                    proc.cpu_affinity(entry["affinity"])
+                restored += 1
+            except (psutil.Error, OSError, ValueError) as e:
+                if not isinstance(e, psutil.NoSuchProcess):
+                    print(f"Failed to restore process {entry['pid']}: {e}")
+        self.entries = {}
+        self.save()
+        return restored
+
 
 class WFPSAgent:
     def __init__(self, api_url: str, token: str):
@@ -26,105 +666,326 @@ class WFPSAgent:
         self.token = token
         self.agent_id = AGENT_ID
         self.headers = {"Authorization": f"Bearer {token}"}
+        self.session = create_session(self.headers)
+        # The long-poll thread gets its own session so it never shares a connection;
+        # it handles reconnects itself, so urllib3 retries are disabled
+        self.push_session = create_session(self.headers, retries=0)
         self.boost_active = False
         self.current_profile = None
+        self.current_games: frozenset = frozenset()  # lowercased process names of current_profile
+        # profile id -> {"etag", "profile", "process_names"}, revalidated with If-None-Match
+        self.profile_cache: Dict[str, Dict] = {}
+        self.telemetry_buffer: List[Dict] = []
+        self.buffer_started: Optional[float] = None
+        self.flush_requested = False  # a buffered sample shouldn't wait for the batch to fill
+        self.command_queue: "queue.Queue[Dict]" = queue.Queue()
+        self.push_connected = False
+        self.command_results: List[Dict] = []
+        self.wire_format = "binary"  # drops to "json" if the backend rejects binary frames
+        self.snapshot: Optional[ProcessSnapshot] = None
+        self.watcher: Optional[ProcessWatcher] = None
+        self.frametimes: Optional[FrameTimeReceiver] = None
+        # Boosts are applied from the main loop and, for newly started games, the watcher thread
+        self.boost_lock = threading.RLock()
+        self.timer = StageTimer()
+        self.sampler = SystemSampler(timer=self.timer)
+        self.last_reported: Optional[Dict] = None
+        self.last_reported_at: Optional[float] = None
+        self.spool: Optional[OfflineSpool] = None
+        if SPOOL_PATH:
+            try:
+                self.spool = OfflineSpool(SPOOL_PATH)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Offline spool unavailable, unsent telemetry will be dropped: {e}")
+        self.replay_after = 0.0  # monotonic time before which the spool isn't replayed
+        self.replay_batch = SPOOL_REPLAY_BATCH  # halved if the backend answers 413
+        self.breaker = CircuitBreaker()
+        self.game_active = False
+        self.last_collected: Optional[float] = None
+        self.journal = BoostJournal(JOURNAL_PATH)
+    
+    @property
+    def active(self) -> bool:
+        """Boosting or gaming, when the agent checks in more often"""
+        return self.boost_active or self.game_active
         
+    def process_snapshot(self) -> ProcessSnapshot:
+        """Process table for this cycle, rescanned once it is older than SNAPSHOT_MAX_AGE"""
+        if self.watcher is not None and self.watcher.is_alive():
+            return self.watcher.snapshot()
+        if self.snapshot is None or time.monotonic() - self.snapshot.created > SNAPSHOT_MAX_AGE:
+            self.snapshot = ProcessSnapshot()
+        return self.snapshot
+    
     def get_system_info(self) -> Dict:
         """Collect system telemetry"""
-        cpu_usage = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        
-        # Get temperature (Windows only)
-        temperature = None
-        if platform.system() == "Windows":
-            try:
-                # Using wmic for Windows temperature
-                result = subprocess.run(
-                    ['wmic', 'path', 'win32_perfformatteddata_counters_thermalzoneinformation', 'get', 'temperature'],
-                    capture_output=True,
-                    text=True,
-                    timeout=2
-                )
-                temp_str = result.stdout.strip().split('\n')[-1].strip()
-                if temp_str.isdigit():
-                    temperature = (int(temp_str) - 2732) / 10  # Convert to Celsius
-            except:
-                pass
+        # Summarise what the background sampler saw since the last cycle;
+        # before its first tick, take a single non-blocking sample instead
+        now = time.monotonic()
+        window = now - self.last_collected if self.last_collected else TELEMETRY_INTERVAL_IDLE
+        self.last_collected = now
+        with self.timer.stage("sampling"):
+            system = self.sampler.summary(window) or self.sampler.sample()
         
         # Detect active game
-        active_game = self.detect_game()
+        with self.timer.stage("process_scan"):
+            active_game = self.detect_game()
+        self.game_active = active_game is not None
+        
+        frames = self.frametimes.collect() if self.frametimes else None
         
         return {
             "agent_id": self.agent_id,
-            "cpu_usage": cpu_usage,
-            "ram_usage": memory.percent,
-            "ram_available": memory.available / (1024**3),  # GB
-            "temperature": temperature,
+            "cpu_usage": system["cpu_usage"],
+            "ram_usage": system["ram_usage"],
+            "ram_available": system["ram_available"],
+            "temperature": system["temperature"],
             "active_game": active_game,
-            "fps": None  # FPS detection requires game-specific integration
+            "fps": frames["fps"] if frames else None,
+            "fps_low_1": frames["fps_low_1"] if frames else None,
+            "fps_low_01": frames["fps_low_01"] if frames else None,
+            "heartbeat_interval": HEARTBEAT_INTERVAL if REPORT_MODE == "delta" else None,
+            "timestamp": datetime.now(timezone.utc).isoformat()
         }
     
+    def should_report(self, sample: Dict) -> bool:
+        """In delta mode, report only changed samples plus a heartbeat when idle"""
+        last = self.last_reported
+        if REPORT_MODE != "delta" or last is None:
+            return True
+        if time.monotonic() - self.last_reported_at >= HEARTBEAT_INTERVAL:
+            return True
+        if sample["active_game"] != last["active_game"]:
+            return True
+        return any(metric_changed(last[metric], sample[metric], threshold)
+                   for metric, threshold in DELTA_THRESHOLDS.items())
+    
     def detect_game(self) -> Optional[str]:
         """Detect if a game is running"""
-        common_games = [
-            "csgo.exe", "valorant.exe", "league of legends.exe", "fortnite.exe",
-            "apex_legends.exe", "cod.exe", "pubg.exe", "overwatch.exe",
-            "minecraft.exe", "dota2.exe", "gta5.exe", "rocketleague.exe"
-        ]
+        proc = self.process_snapshot().search(GAME_PATTERN)
+        return proc.info['name'] if proc else None
+    
+    def post_json(self, path: str, data, timeout: float) -> requests.Response:
+        """POST a JSON body, gzip-compressed when it is large enough to benefit"""
+        body = json.dumps(data).encode('utf-8')
+        headers = {"Content-Type": "application/json"}
+        if len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        return self.session.post(f"{self.api_url}{path}", data=body, headers=headers, timeout=timeout)
+    
+    def post_telemetry(self, path: str, samples: List[Dict], timeout: float) -> requests.Response:
+        """POST telemetry as a binary frame, falling back to JSON for older backends"""
+        if self.wire_format == "binary":
+            response = self.session.post(
+                f"{self.api_url}{path}",
+                data=encode_binary_telemetry(samples),
+                headers={"Content-Type": TELEMETRY_BINARY_TYPE},
+                timeout=timeout
+            )
+            if response.status_code not in (400, 415, 422):
+                return response
+            print("Backend rejected binary telemetry, falling back to JSON")
+            self.wire_format = "json"
         
-        for proc in psutil.process_iter(['name']):
-            try:
-                proc_name = proc.info['name'].lower()
-                for game in common_games:
-                    if game in proc_name:
-                        return proc.info['name']
-            except:
-                continue
-        return None
+        return self.post_json(path, samples, timeout)
+    
+    def queue_telemetry(self, data: Dict):
+        """Buffer a telemetry sample; game switches and heartbeats are sent on this tick"""
+        now = time.monotonic()
+        if not self.telemetry_buffer:
+            self.buffer_started = now
+        last = self.last_reported
+        if last is not None and (last["active_game"] != data["active_game"] or
+                                 (REPORT_MODE == "delta" and now - self.last_reported_at >= HEARTBEAT_INTERVAL)):
+            self.flush_requested = True
+        self.telemetry_buffer.append(data)
+    
+    def flush_due(self) -> bool:
+        """Checked every telemetry tick, so a buffer doesn't wait for the next sample to be flushed"""
+        if not self.telemetry_buffer or not self.breaker.allow():
+            return False
+        max_age = DELTA_FLUSH_INTERVAL if REPORT_MODE == "delta" else TELEMETRY_FLUSH_INTERVAL
+        return (self.flush_requested or len(self.telemetry_buffer) >= TELEMETRY_BATCH_SIZE or
+                time.monotonic() - self.buffer_started >= max_age)
     
-    def send_telemetry(self, data: Dict) -> bool:
-        """Send telemetry to backend"""
+    def flush_telemetry(self) -> bool:
+        """Send all buffered telemetry in a single batch request"""
+        if not self.telemetry_buffer:
+            return True
+        
+        batch = self.telemetry_buffer
         try:
-            response = requests.post(
-                f"{self.api_url}/telemetry",
-                json=data,
-                headers=self.headers,
-                timeout=5
-            )
-            return response.status_code == 200
+            response = self.post_telemetry("/telemetry/batch", batch, timeout=10)
+            if response.status_code == 200:
+                self.breaker.record_success()
+                self.telemetry_buffer = []
+                self.buffer_started = None
+                self.flush_requested = False
+                return True
+            print(f"Failed to send telemetry batch: HTTP {response.status_code}")
         except Exception as e:
-            print(f"Failed to send telemetry: {e}")
-            return False
+            print(f"Failed to send telemetry batch: {e}")
+        self.breaker.record_failure()
+        
+        if self.spool is not None:
+            self.spool.put("telemetry", batch)
+            self.telemetry_buffer = []
+            self.buffer_started = None
+            self.flush_requested = False
+        elif len(batch) > TELEMETRY_BUFFER_MAX:
+            # Keep samples for the next attempt, but never grow without bound
+            del batch[:len(batch) - TELEMETRY_BUFFER_MAX]
+        return False
     
-    def get_pending_commands(self) -> List[Dict]:
-        """Fetch pending boost commands from backend"""
+    def replay_spool(self) -> bool:
+        """Send spooled items in large batches, a bounded number of requests per cycle"""
+        if self.spool is None or time.monotonic() < self.replay_after or not self.breaker.allow():
+            return True
+        for _ in range(SPOOL_REPLAY_BATCHES):
+            rows = self.spool.peek("command_result", self.replay_batch)
+            if rows:
+                path, kind = "/boost/commands/status", "command_result"
+            else:
+                rows = self.spool.peek("telemetry", self.replay_batch)
+                if not rows:
+                    return True
+                # A frame holds one agent_id, and samples from earlier runs have another
+                rows = [row for row in rows if row[1] == rows[0][1]]
+                path, kind = "/telemetry/batch", "telemetry"
+            
+            items = [item for _, _, item in rows]
+            try:
+                if kind == "telemetry":
+                    response = self.post_telemetry(path, items, timeout=30)
+                else:
+                    response = self.session.put(f"{self.api_url}{path}", json=items, timeout=10)
+            except Exception as e:
+                print(f"Spool replay failed: {e}")
+                self.breaker.record_failure()
+                return False
+            
+            if response.status_code in (429, 503):
+                # The backend is shedding load; wait as long as it asks before trying again
+                retry_after = response.headers.get("Retry-After", "")
+                self.replay_after = time.monotonic() + (float(retry_after) if retry_after.isdigit() else BREAKER_BACKOFF_MAX / 10)
+                return False
+            if response.status_code == 413 and len(rows) > 1:
+                # The backend's batch limit is lower than ours; retry with half as many
+                self.replay_batch = max(1, len(rows) // 2)
+                continue
+            if response.status_code in (401, 403):
+                # Fixed by a new token, so the rows are kept
+                print(f"Spool replay failed: HTTP {response.status_code}")
+                return False
+            if 400 <= response.status_code < 500:
+                # Never going to be accepted; dropping them keeps the rest of the spool moving
+                print(f"Dropping {len(items)} spooled {kind} items rejected with HTTP {response.status_code}")
+                self.spool.remove([row_id for row_id, _, _ in rows])
+                continue
+            if response.status_code != 200:
+                print(f"Spool replay failed: HTTP {response.status_code}")
+                return False
+            self.spool.remove([row_id for row_id, _, _ in rows])
+            print(f"Replayed {len(items)} spooled {kind} items")
+        return True
+    
+    def claim_commands(self) -> List[Dict]:
+        """Atomically claim pending commands for this agent"""
         try:
-            response = requests.get(
-                f"{self.api_url}/boost/commands/pending",
-                headers=self.headers,
+            response = self.session.post(
+                f"{self.api_url}/boost/commands/claim",
+                json={"agent_id": self.agent_id},
                 timeout=5
             )
             if response.status_code == 200:
+                self.breaker.record_success()
                 return response.json()
+            self.breaker.record_failure()
             return []
         except Exception as e:
-            print(f"Failed to fetch commands: {e}")
+            print(f"Failed to claim commands: {e}")
+            self.breaker.record_failure()
             return []
     
-    def update_command_status(self, command_id: str, status: str):
-        """Update command status in backend"""
+    def wait_for_commands(self) -> Optional[List[Dict]]:
+        """Long-poll the backend until commands are claimed; None if the channel is unavailable"""
+        try:
+            response = self.push_session.get(
+                f"{self.api_url}/boost/commands/wait",
+                params={"timeout": COMMAND_WAIT_TIMEOUT, "agent_id": self.agent_id},
+                timeout=COMMAND_WAIT_TIMEOUT + 10
+            )
+            if response.status_code == 200:
+                return response.json()
+            return None
+        except Exception:
+            return None
+    
+    def listen_for_commands(self):
+        """Background thread feeding pushed commands into the command queue"""
+        while True:
+            commands = self.wait_for_commands()
+            if commands is None:
+                if self.push_connected:
+                    print("Command push channel lost, falling back to polling")
+                self.push_connected = False
+                time.sleep(COMMAND_WAIT_RETRY)
+                continue
+            
+            if not self.push_connected:
+                print("Command push channel connected")
+            self.push_connected = True
+            for command in commands:
+                self.command_queue.put(command)
+    
+    def process_queued_commands(self, timeout: float):
+        """Execute pushed commands as they arrive, for up to `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                commands = [self.command_queue.get(timeout=remaining)]
+            except queue.Empty:
+                return
+            # Run everything that arrived together, then report it in one request
+            while not self.command_queue.empty():
+                commands.append(self.command_queue.get_nowait())
+            with self.timer.stage("commands"):
+                for command in commands:
+                    self.execute_command(command)
+            with self.timer.stage("network"):
+                self.report_command_results()
+    
+    def report_command_results(self) -> bool:
+        """Send the final status of executed commands in a single request"""
+        if not self.command_results or not self.breaker.allow():
+            return True
         try:
-            requests.put(
-                f"{self.api_url}/boost/command/{command_id}/status",
-                params={"status": status},
-                headers=self.headers,
+            response = self.session.put(
+                f"{self.api_url}/boost/commands/status",
+                json=self.command_results,
                 timeout=5
             )
+            if response.status_code == 200:
+                self.breaker.record_success()
+                self.command_results = []
+                return True
+            print(f"Failed to report command results: HTTP {response.status_code}")
         except Exception as e:
-            print(f"Failed to update command status: {e}")
+            print(f"Failed to report command results: {e}")
+        self.breaker.record_failure()
+        
+        if self.spool is not None:
+            self.spool.put("command_result", self.command_results)
+            self.command_results = []
+        return False
     
-    def set_process_priority(self, process_name: str, priority: str) -> bool:
-        """Set process priority"""
+    @staticmethod
+    def priority_value(priority: str) -> int:
+        """nice value (or Windows priority class) for a profile priority level"""
         priority_map = {
             "low": psutil.IDLE_PRIORITY_CLASS if platform.system() == "Windows" else 19,
             "below_normal": psutil.BELOW_NORMAL_PRIORITY_CLASS if platform.system() == "Windows" else 10,
@@ -134,20 +995,22 @@ class WFPSAgent:
             "realtime": psutil.REALTIME_PRIORITY_CLASS if platform.system() == "Windows" else -20
         }
         
-        try:
-            for proc in psutil.process_iter(['name']):
-                if proc.info['name'].lower() == process_name.lower():
-                    p = psutil.Process(proc.pid)
-                    if platform.system() == "Windows":
-                        p.nice(priority_map.get(priority, psutil.NORMAL_PRIORITY_CLASS))
-                    else:
-                        p.nice(priority_map.get(priority, 0))
-                    print(f"Set {process_name} to {priority} priority")
-                    return True
-            return False
-        except Exception as e:
-            print(f"Failed to set priority for {process_name}: {e}")
-            return False
+        default = psutil.NORMAL_PRIORITY_CLASS if platform.system() == "Windows" else 0
+        return priority_map.get(priority, default)
+    
+    def set_process_priority(self, process_name: str, priority: str) -> bool:
+        """Set process priority"""
+        updated = False
+        for proc in self.process_snapshot().find(process_name):
+            try:
+                self.journal.record(proc, "nice", proc.nice())
+                proc.nice(self.priority_value(priority))
+                updated = True
+            except Exception as e:
+                print(f"Failed to set priority for {process_name}: {e}")
+        if updated:
+            print(f"Set {process_name} to {priority} priority")
+        return updated
     
     def clear_memory(self) -> bool:
         """Clear standby memory (Windows only)"""
@@ -168,67 +1031,210 @@ class WFPSAgent:
     
     def kill_background_apps(self, whitelist: List[str]) -> int:
         """Kill non-essential background processes"""
-        # Protected processes that should never be killed
-        protected = [
-            'system', 'registry', 'smss.exe', 'csrss.exe', 'wininit.exe',
-            'services.exe', 'lsass.exe', 'svchost.exe', 'explorer.exe',
-            'dwm.exe', 'taskmgr.exe', 'python.exe', 'wfps_agent.exe'
-        ]
+        whitelist_pattern = re.compile("|".join(re.escape(w.lower()) for w in whitelist)) if whitelist else None
+        snapshot = self.process_snapshot()
         
         killed_count = 0
-        for proc in psutil.process_iter(['name', 'username']):
-            try:
-                proc_name = proc.info['name'].lower()
-                
-                # Skip protected and whitelisted processes
-                if any(p in proc_name for p in protected) or any(w in proc_name for w in whitelist):
-                    continue
-                
-                # Kill non-essential processes
-                if proc_name in ['chrome.exe', 'discord.exe', 'spotify.exe', 'slack.exe']:
+        for proc_name in BACKGROUND_APPS.intersection(snapshot.by_name):
+            # Skip protected and whitelisted processes
+            if PROTECTED_PATTERN.search(proc_name) or (whitelist_pattern and whitelist_pattern.search(proc_name)):
+                continue
+            
+            for proc in snapshot.find(proc_name):
+                try:
                     proc.terminate()
                     killed_count += 1
                     print(f"Terminated: {proc_name}")
-            except:
-                continue
+                except:
+                    continue
         
         return killed_count
     
-    def apply_boost_profile(self, profile: Dict):
-        """Apply optimization profile"""
-        print(f"\nApplying profile: {profile.get('name', 'Unknown')}")
+    def set_cpu_affinity(self, proc: psutil.Process, cores: List[int]) -> bool:
+        """Move a process onto cores, journaling its original affinity"""
+        try:
+            original = proc.cpu_affinity()
+            if sorted(original) == cores:
+                return False
+            self.journal.record(proc, "affinity", original)
+            proc.cpu_affinity(cores)
+        except (psutil.Error, OSError, ValueError) as e:
+            print(f"Failed to set CPU affinity for {proc.pid}: {e}")
+            return False
+        return True
+    
+    def find_heavy_processes(self, exclude: set) -> List[psutil.Process]:
+        """This user's processes using at least HEAVY_PROCESS_CPU, except protected and excluded ones"""
+        user = psutil.Process().username()
+        candidates = []
+        for name, procs in self.process_snapshot().by_name.items():
+            if name in exclude or PROTECTED_PATTERN.search(name):
+                continue
+            for proc in procs:
+                try:
+                    if proc.pid == os.getpid() or proc.username() != user:
+                        continue
+                    proc.cpu_percent(interval=None)  # prime, like the sampler
+                    candidates.append(proc)
+                except psutil.Error:
+                    continue
         
-        # Set process priorities
-        for process_name in profile.get('process_names', []):
-            self.set_process_priority(process_name, profile.get('priority_level', 'high'))
+        time.sleep(HEAVY_SAMPLE_WINDOW)
+        heavy = []
+        for proc in candidates:
+            try:
+                if proc.cpu_percent(interval=None) >= HEAVY_PROCESS_CPU:
+                    heavy.append(proc)
+            except psutil.Error:
+                continue
+        return heavy
+    
+    @staticmethod
+    def game_cores(profile: Dict) -> List[int]:
+        """The profile's game_cores that exist on this machine, empty if affinity is unsupported"""
+        if not profile.get('game_cores') or not hasattr(psutil.Process, "cpu_affinity"):
+            return []
+        return sorted(set(profile['game_cores']).intersection(range(psutil.cpu_count() or 1)))
+    
+    def partition_cores(self, profile: Dict, heavy: List[psutil.Process]) -> int:
+        """Pin the profile's games to game_cores and move the heavy processes to the rest"""
+        game_cores = self.game_cores(profile)
+        if not game_cores:
+            print(f"CPU affinity not changed: no usable game cores in {profile['game_cores']}")
+            return 0
+        all_cores = list(range(psutil.cpu_count() or 1))
         
-        # Clear memory if enabled
-        if profile.get('clear_memory', True):
-            self.clear_memory()
+        snapshot = self.process_snapshot()
+        moved = 0
+        for name in self.current_games:
+            for proc in snapshot.find(name):
+                moved += self.set_cpu_affinity(proc, game_cores)
         
-        # Kill background apps if enabled
-        if profile.get('kill_background_apps', True):
-            whitelist = profile.get('background_apps_whitelist', [])
-            killed = self.kill_background_apps(whitelist)
-            print(f"Terminated {killed} background processes")
+        other_cores = [core for core in all_cores if core not in game_cores]
+        if other_cores:
+            for proc in heavy:
+                moved += self.set_cpu_affinity(proc, other_cores)
+        return moved
+    
+    def restore_processes(self):
+        """Undo the priority and affinity changes of every boost since the last restore"""
+        if not self.journal:
+            return
+        restored = self.journal.restore()
+        print(f"Restored priority and CPU affinity of {restored} processes")
+    
+    def boost_started_processes(self, started: List[psutil.Process]):
+        """Watcher callback: give games that start mid-boost the profile's priority and cores"""
+        with self.boost_lock:
+            profile = self.current_profile
+            if not self.boost_active or not profile:
+                return
+            games = [proc for proc in started if proc.info['name'].lower() in self.current_games]
+            if not games:
+                return
+            
+            priority = profile.get('priority_level', 'high')
+            game_cores = self.game_cores(profile)
+            for proc in games:
+                try:
+                    self.journal.record(proc, "nice", proc.nice())
+                    proc.nice(self.priority_value(priority))
+                    print(f"Set {proc.info['name']} to {priority} priority")
+                except Exception as e:
+                    print(f"Failed to set priority for {proc.info['name']}: {e}")
+                if game_cores:
+                    self.set_cpu_affinity(proc, game_cores)
+            self.journal.save()
+    
+    def apply_boost_profile(self, profile: Dict, process_names: Optional[frozenset] = None):
+        """Apply optimization profile"""
+        games = process_names or frozenset(name.lower() for name in profile.get('process_names', []))
+        print(f"\nApplying profile: {profile.get('name', 'Unknown')}")
+        if self.watcher is None or not self.watcher.is_alive():
+            # One fresh scan shared by the priority and background-app steps
+            self.snapshot = ProcessSnapshot()
+        
+        # Measured before taking boost_lock, so the sample window doesn't hold up the watcher callback
+        heavy = []
+        if self.game_cores(profile) and profile.get('move_heavy_processes', True):
+            heavy = self.find_heavy_processes(games)
         
-        self.boost_active = True
-        self.current_profile = profile
-        print("Boost applied successfully!")
+        with self.boost_lock:
+            self.current_games = games
+            try:
+                # Set process priorities
+                for process_name in profile.get('process_names', []):
+                    self.set_process_priority(process_name, profile.get('priority_level', 'high'))
+                
+                # Clear memory if enabled
+                if profile.get('clear_memory', True):
+                    self.clear_memory()
+                
+                # Kill background apps if enabled
+                if profile.get('kill_background_apps', True):
+                    whitelist = profile.get('background_apps_whitelist', [])
+                    killed = self.kill_background_apps(whitelist)
+                    print(f"Terminated {killed} background processes")
+                
+                # Partition CPU cores between the game and everything else
+                if profile.get('game_cores'):
+                    moved = self.partition_cores(profile, heavy)
+                    print(f"Changed CPU affinity of {moved} processes")
+            finally:
+                # Persist whatever was changed, even if a step failed part-way
+                self.journal.save()
+            
+            self.boost_active = True
+            self.current_profile = profile
+            print("Boost applied successfully!")
     
     def stop_boost(self):
         """Stop boost mode"""
-        self.boost_active = False
-        self.current_profile = None
+        with self.boost_lock:
+            self.restore_processes()
+            self.boost_active = False
+            self.current_profile = None
+            self.current_games = frozenset()
         print("Boost deactivated")
     
+    def fetch_profile(self, profile_id: str) -> Optional[Dict]:
+        """Cached profile entry, downloaded again only when the backend says it changed"""
+        cached = self.profile_cache.get(profile_id)
+        try:
+            response = self.session.get(
+                f"{self.api_url}/profiles/{profile_id}",
+                headers={"If-None-Match": cached["etag"]} if cached else None,
+                timeout=5
+            )
+        except requests.RequestException:
+            if cached is None:
+                raise
+            print("Backend unreachable, applying the cached profile")
+            return cached
+        
+        if response.status_code == 304 and cached is not None:
+            return cached
+        if response.status_code == 200:
+            profile = response.json()
+            entry = {
+                "etag": response.headers.get("ETag"),
+                "profile": profile,
+                "process_names": frozenset(name.lower() for name in profile.get('process_names', [])),
+            }
+            if entry["etag"]:
+                self.profile_cache[profile_id] = entry
+            return entry
+        if response.status_code == 404:
+            self.profile_cache.pop(profile_id, None)
+        return None
+    
     def execute_command(self, command: Dict):
         """Execute boost command"""
         command_id = command['id']
         action = command['action']
         
-        self.update_command_status(command_id, "executing")
-        
+        # Claimed commands are already "executing" on the backend; the final
+        # status is queued and sent with report_command_results
         try:
             if action == "start_boost":
                 # Apply general boost
@@ -246,22 +1252,18 @@ class WFPSAgent:
                 # Fetch and apply specific profile
                 profile_id = command.get('profile_id')
                 if profile_id:
-                    response = requests.get(
-                        f"{self.api_url}/profiles/{profile_id}",
-                        headers=self.headers,
-                        timeout=5
-                    )
-                    if response.status_code == 200:
-                        self.apply_boost_profile(response.json())
+                    entry = self.fetch_profile(profile_id)
+                    if entry:
+                        self.apply_boost_profile(entry["profile"], entry["process_names"])
             
             elif action == "stop_boost":
                 self.stop_boost()
             
-            self.update_command_status(command_id, "completed")
+            self.command_results.append({"id": command_id, "status": "completed"})
         
         except Exception as e:
             print(f"Command execution failed: {e}")
-            self.update_command_status(command_id, "failed")
+            self.command_results.append({"id": command_id, "status": "failed"})
     
     def run(self):
         """Main agent loop"""
@@ -270,32 +1272,85 @@ class WFPSAgent:
         print(f"System: {platform.system()} {platform.release()}")
         print("\nAgent is running... Press Ctrl+C to stop\n")
         
+        if self.journal:
+            # A previous run crashed or was killed while boosting
+            print("Undoing process changes left by a previous run")
+            self.restore_processes()
+        
+        self.sampler.start()
+        self.watcher = ProcessWatcher(timer=self.timer)
+        self.watcher.listeners.append(self.boost_started_processes)
+        self.watcher.start()
+        if FRAMETIME_PORT:
+            try:
+                self.frametimes = FrameTimeReceiver(FRAMETIME_PORT)
+                self.frametimes.start()
+            except OSError as e:
+                print(f"Frame time input unavailable on UDP port {FRAMETIME_PORT}: {e}")
+        threading.Thread(target=self.listen_for_commands, daemon=True).start()
+        
+        # Start at a random point in the first interval so agents launched together don't stay in step
+        next_telemetry = time.monotonic() + random.uniform(0, TELEMETRY_INTERVAL_ACTIVE)
+        next_commands = time.monotonic() + random.uniform(0, COMMAND_INTERVAL_ACTIVE)
+        
         while True:
             try:
-                # Collect and send telemetry
-                telemetry = self.get_system_info()
-                self.send_telemetry(telemetry)
-                
-                # Check for pending commands
-                commands = self.get_pending_commands()
-                for command in commands:
-                    self.execute_command(command)
+                now = time.monotonic()
+                if self.active:
+                    # A boost or game that started mid-interval tightens the schedule right away
+                    next_telemetry = min(next_telemetry, now + TELEMETRY_INTERVAL_ACTIVE)
+                    next_commands = min(next_commands, now + COMMAND_INTERVAL_ACTIVE)
+                if now >= next_telemetry:
+                    # Collect and send telemetry
+                    self.timer.cycle()
+                    telemetry = self.get_system_info()
+                    if self.should_report(telemetry):
+                        telemetry["agent_timings"] = self.timer.report()
+                        with self.timer.stage("network"):
+                            self.queue_telemetry(telemetry)
+                        self.last_reported = telemetry
+                        self.last_reported_at = time.monotonic()
+                    with self.timer.stage("network"):
+                        if self.flush_due():
+                            self.flush_telemetry()
+                        self.report_command_results()
+                        self.replay_spool()
+                    
+                    # Display status
+                    status = "🟢 BOOST ACTIVE" if self.boost_active else "⚪ IDLE"
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] {status} | "
+                          f"CPU: {telemetry['cpu_usage']:.1f}% | "
+                          f"RAM: {telemetry['ram_usage']:.1f}% | "
+                          f"Game: {telemetry['active_game'] or 'None'}")
+                    
+                    interval = TELEMETRY_INTERVAL_ACTIVE if self.active else TELEMETRY_INTERVAL_IDLE
+                    next_telemetry = now + jittered(interval)
                 
-                # Display status
-                status = "🟢 BOOST ACTIVE" if self.boost_active else "⚪ IDLE"
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] {status} | "
-                      f"CPU: {telemetry['cpu_usage']:.1f}% | "
-                      f"RAM: {telemetry['ram_usage']:.1f}% | "
-                      f"Game: {telemetry['active_game'] or 'None'}")
+                # Pushed commands are handled while waiting; poll only if the channel is down
+                if now >= next_commands:
+                    if not self.push_connected and self.breaker.allow():
+                        with self.timer.stage("network"):
+                            commands = self.claim_commands()
+                        with self.timer.stage("commands"):
+                            for command in commands:
+                                self.execute_command(command)
+                        with self.timer.stage("network"):
+                            self.report_command_results()
+                    interval = COMMAND_INTERVAL_ACTIVE if self.active else COMMAND_INTERVAL_IDLE
+                    next_commands = now + jittered(interval)
                 
-                time.sleep(POLL_INTERVAL)
+                self.process_queued_commands(min(next_telemetry, next_commands) - time.monotonic())
             
             except KeyboardInterrupt:
+                # Don't leave priorities and affinity skewed until the next start
+                if self.boost_active or self.journal:
+                    self.stop_boost()
+                self.flush_telemetry()
                 print("\nAgent stopped by user")
                 break
             except Exception as e:
                 print(f"Error in main loop: {e}")
-                time.sleep(POLL_INTERVAL)
+                time.sleep(jittered(TELEMETRY_INTERVAL_IDLE))
 
 def main():
     print("="*60)
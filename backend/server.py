@@ -1,34 +1,142 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
+from pymongo import monitoring
 import os
+import time
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter, ValidationError
+from typing import List, Optional, Dict, Any, Set, Tuple, Hashable, AsyncIterator
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
+import io
+import csv
+import json
+import zlib
+import struct
+import bisect
+import threading
 import bcrypt
 import jwt
+import orjson
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional, only needed when LATEST_CACHE_URL is set
+    aioredis = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ========== METRICS ==========
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Histogram:
+    """Prometheus-style histogram, one series per label combination."""
+    
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # Observed from the event loop and from pymongo's monitoring threads
+        self.lock = threading.Lock()
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+    
+    def observe(self, labels: Tuple[str, ...], value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {labels: list(series) for labels, series in self.series.items()}
+        for labels, series in sorted(snapshot.items()):
+            label_text = ",".join(f'{k}="{escape_label(v)}"' for k, v in zip(self.label_names, labels))
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+request_latency = Histogram("wfps_http_request_duration_seconds", "Time to handle an HTTP request.",
+                            ("method", "route", "status"), LATENCY_BUCKETS)
+request_size = Histogram("wfps_http_request_size_bytes", "HTTP request body size as received.",
+                         ("method", "route"), SIZE_BUCKETS)
+response_size = Histogram("wfps_http_response_size_bytes", "HTTP response body size.",
+                          ("method", "route"), SIZE_BUCKETS)
+mongo_latency = Histogram("wfps_mongo_command_duration_seconds", "MongoDB command round-trip time.",
+                          ("command", "collection", "outcome"), LATENCY_BUCKETS)
+agent_stage_time = Histogram("wfps_agent_stage_duration_seconds", "Agent time per cycle stage, as reported with telemetry.",
+                             ("stage",), LATENCY_BUCKETS)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command the driver sends."""
+    
+    def __init__(self):
+        self.collections: Dict[Tuple[Any, int], str] = {}
+    
+    def started(self, event):
+        # Most commands name their collection as the value of the command key
+        target = event.command.get(event.command_name)
+        self.collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+    
+    def finished(self, event, outcome: str):
+        collection = self.collections.pop((event.connection_id, event.request_id), "")
+        mongo_latency.observe((event.command_name, collection, outcome), event.duration_micros / 1e6)
+    
+    def succeeded(self, event):
+        self.finished(event, "success")
+    
+    def failed(self, event):
+        self.finished(event, "failure")
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
 # JWT Secret
 JWT_SECRET = os.environ.get('JWT_SECRET', 'wfps_secret_key_change_in_production')
 JWT_ALGORITHM = "HS256"
 
+# Telemetry retention (raw samples and rollups)
+TELEMETRY_TTL_DAYS = float(os.environ.get('TELEMETRY_TTL_DAYS', '7'))
+TELEMETRY_1M_TTL_DAYS = float(os.environ.get('TELEMETRY_1M_TTL_DAYS', '30'))
+TELEMETRY_1H_TTL_DAYS = float(os.environ.get('TELEMETRY_1H_TTL_DAYS', '365'))
+
 # Create the main app
 app = FastAPI(title="wFPS API")
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # ========== MODELS ==========
 
@@ -58,6 +166,8 @@ class GameProfile(BaseModel):
     kill_background_apps: bool = True
     clear_memory: bool = True
     background_apps_whitelist: List[str] = []
+    game_cores: List[int] = []  # pin process_names to these CPU cores; empty leaves affinity alone
+    move_heavy_processes: bool = True  # with game_cores, push other busy processes onto the remaining cores
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -68,6 +178,8 @@ class GameProfileCreate(BaseModel):
     kill_background_apps: bool = True
     clear_memory: bool = True
     background_apps_whitelist: List[str] = []
+    game_cores: List[int] = []
+    move_heavy_processes: bool = True
 
 class GameProfileUpdate(BaseModel):
     name: Optional[str] = None
@@ -76,6 +188,8 @@ class GameProfileUpdate(BaseModel):
     kill_background_apps: Optional[bool] = None
     clear_memory: Optional[bool] = None
     background_apps_whitelist: Optional[List[str]] = None
+    game_cores: Optional[List[int]] = None
+    move_heavy_processes: Optional[bool] = None
 
 class AgentTelemetry(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -88,6 +202,10 @@ class AgentTelemetry(BaseModel):
     temperature: Optional[float] = None
     active_game: Optional[str] = None
     fps: Optional[int] = None
+    fps_low_1: Optional[float] = None  # 1% low: average FPS of the slowest 1% of frames
+    fps_low_01: Optional[float] = None  # 0.1% low
+    agent_timings: Optional[Dict[str, float]] = None  # agent milliseconds per cycle, by stage
+    heartbeat_interval: Optional[int] = None
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class AgentTelemetryCreate(BaseModel):
@@ -98,6 +216,17 @@ class AgentTelemetryCreate(BaseModel):
     temperature: Optional[float] = None
     active_game: Optional[str] = None
     fps: Optional[int] = None
+    fps_low_1: Optional[float] = None
+    fps_low_01: Optional[float] = None
+    agent_timings: Optional[Dict[str, float]] = None
+    heartbeat_interval: Optional[int] = None  # seconds; set by agents that only report changes
+    timestamp: Optional[datetime] = None  # set by agents that buffer samples
+
+class AgentStatus(BaseModel):
+    agent_id: str
+    last_seen: datetime
+    heartbeat_interval: Optional[int] = None
+    online: bool
 
 class BoostCommand(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -106,31 +235,646 @@ class BoostCommand(BaseModel):
     profile_id: Optional[str] = None
     action: str  # "start_boost", "stop_boost", "apply_profile"
     status: str = "pending"  # pending, executing, completed, failed
+    agent_id: Optional[str] = None  # set when an agent claims the command
+    claimed_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class BoostCommandCreate(BaseModel):
     profile_id: Optional[str] = None
     action: str
 
+class BoostCommandClaim(BaseModel):
+    agent_id: str
+    limit: int = Field(default=10, ge=1, le=100)
+
+class BoostCommandStatusUpdate(BaseModel):
+    id: str
+    status: str
+
+# ========== RESPONSES ==========
+
+# Read routes hand projected documents straight to orjson instead of building
+# response models for data that was validated when it was written.
+# response_model stays on those routes for the OpenAPI schema.
+
+# Z suffix and UTC for naive values, as the pydantic serializer produced before
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+def model_projection(model: type, exclude: Tuple[str, ...] = ()) -> Dict[str, int]:
+    return {"_id": 0, **{name: 1 for name in model.model_fields if name not in exclude}}
+
+def model_defaults(model: type) -> Dict[str, Any]:
+    # Documents written before a field existed get its default, as model validation used to fill in
+    return {name: field.default for name, field in model.model_fields.items()
+            if not field.is_required() and field.default_factory is None}
+
+PROFILE_PROJECTION = model_projection(GameProfile)
+PROFILE_DEFAULTS = model_defaults(GameProfile)
+TELEMETRY_PROJECTION = {**model_projection(AgentTelemetry, exclude=("user_id", "agent_id")), "meta": 1}
+TELEMETRY_DEFAULTS = model_defaults(AgentTelemetry)
+COMMAND_PROJECTION = model_projection(BoostCommand)
+COMMAND_DEFAULTS = model_defaults(BoostCommand)
+AGENT_PROJECTION = model_projection(AgentStatus, exclude=("online",))
+AGENT_DEFAULTS = model_defaults(AgentStatus)
+
+# ========== CACHES ==========
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry when full."""
+    
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self.entries:
+            return default
+        self.entries.move_to_end(key)
+        return self.entries[key]
+    
+    def set(self, key: Hashable, value: Any):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        return self.entries.pop(key, default)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class LatestTelemetryCache:
+    """Newest telemetry sample per user and per agent, kept in process memory."""
+    
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.samples = LRUCache(maxsize)
+        # Other workers may have received newer samples since; entries are only served this long
+        self.ttl_seconds = ttl_seconds
+    
+    @staticmethod
+    def keys(sample: Dict[str, Any]) -> List[Tuple[str, Optional[str]]]:
+        return [(sample["user_id"], None), (sample["user_id"], sample["agent_id"])]
+    
+    async def get(self, user_id: str, agent_id: Optional[str] = None, stale_ok: bool = False) -> Optional[Dict[str, Any]]:
+        entry = self.samples.get((user_id, agent_id))
+        if entry is None:
+            return None
+        sample, stored = entry
+        if not stale_ok and time.monotonic() - stored > self.ttl_seconds:
+            return None
+        return dict(sample)
+    
+    async def put(self, sample: Dict[str, Any], keys: Optional[List[Tuple[str, Optional[str]]]] = None):
+        # Samples can arrive out of order from buffering agents; keep the newest
+        for key in keys or self.keys(sample):
+            current = self.samples.get(key)
+            if current is None or current[0]["timestamp"] <= sample["timestamp"]:
+                self.samples.set(key, (sample, time.monotonic()))
+
+class RedisLatestTelemetryCache(LatestTelemetryCache):
+    """Shared variant for multi-worker deployments, stored in Redis."""
+    
+    # Replace the stored sample only if the incoming one is at least as new
+    PUT_SCRIPT = """
+    local current = redis.call('HGET', KEYS[1], 'ts')
+    if current and tonumber(current) > tonumber(ARGV[1]) then return 0 end
+    redis.call('HSET', KEYS[1], 'ts', ARGV[1], 'sample', ARGV[2])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return 1
+    """
+    
+    def __init__(self, url: str, ttl_seconds: int):
+        if aioredis is None:
+            raise RuntimeError("LATEST_CACHE_URL is set but the redis package is not installed")
+        self.redis = aioredis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.put_script = self.redis.register_script(self.PUT_SCRIPT)
+    
+    @staticmethod
+    def redis_key(user_id: str, agent_id: Optional[str]) -> str:
+        return f"wfps:latest:{user_id}:{agent_id or '*'}"
+    
+    async def get(self, user_id: str, agent_id: Optional[str] = None, stale_ok: bool = False) -> Optional[Dict[str, Any]]:
+        # Shared by every worker, so never stale in that sense; entries expire with the telemetry TTL
+        raw = await self.redis.hget(self.redis_key(user_id, agent_id), "sample")
+        return orjson.loads(raw) if raw else None
+    
+    async def put(self, sample: Dict[str, Any], keys: Optional[List[Tuple[str, Optional[str]]]] = None):
+        # Serialized like FastJSONResponse, so both cache backends render the same body
+        payload = orjson.dumps(sample, option=ORJSON_OPTIONS)
+        ts = sample["timestamp"].timestamp()
+        for user_id, agent_id in keys or self.keys(sample):
+            await self.put_script(keys=[self.redis_key(user_id, agent_id)], args=[ts, payload, self.ttl_seconds])
+
+LATEST_CACHE_URL = os.environ.get('LATEST_CACHE_URL')
+if LATEST_CACHE_URL:
+    latest_cache: LatestTelemetryCache = RedisLatestTelemetryCache(LATEST_CACHE_URL, int(TELEMETRY_TTL_DAYS * 86400))
+else:
+    latest_cache = LatestTelemetryCache(int(os.environ.get('LATEST_CACHE_SIZE', '20000')),
+                                        float(os.environ.get('LATEST_CACHE_TTL', '5')))
+
+# ========== INDEXES ==========
+
+# Bump when the index definitions below change; stale indexes are dropped on the next startup
+INDEX_VERSION = 5
+
+def rollup_indexes(ttl_days: float) -> List[IndexModel]:
+    return [
+        IndexModel([("user_id", ASCENDING), ("agent_id", ASCENDING), ("timestamp", ASCENDING)], name="bucket_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_id_timestamp"),
+        IndexModel([("timestamp", ASCENDING)], name="timestamp_ttl", expireAfterSeconds=int(ttl_days * 86400)),
+    ]
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "profiles": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "telemetry": [
+        IndexModel([("meta.user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_id_timestamp"),
+        IndexModel([("meta.user_id", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)], name="user_id_timestamp_id"),
+    ],
+    "agents": [
+        IndexModel([("user_id", ASCENDING), ("agent_id", ASCENDING)], name="user_id_agent_id_unique", unique=True),
+    ],
+    "telemetry_1m": rollup_indexes(TELEMETRY_1M_TTL_DAYS),
+    "telemetry_1h": rollup_indexes(TELEMETRY_1H_TTL_DAYS),
+    "boost_commands": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING)], name="user_id_status_created_at"),
+    ],
+}
+
+async def ensure_indexes():
+    state = await db.schema_info.find_one({"_id": "indexes"}) or {}
+    # Versions are kept per collection, so a collection that failed is upgraded again on the next startup
+    versions = state.get("versions") or dict.fromkeys(INDEXES, state.get("version", 0))
+    # Only indexes we declared ourselves are ever dropped; time-series
+    # collections carry server-created indexes that must be left alone
+    previously_managed = state.get("managed", {})
+    
+    update = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        upgrading = versions.get(collection_name, 0) < INDEX_VERSION
+        wanted = [index.document["name"] for index in indexes]
+        if upgrading:
+            existing = await collection.index_information()
+            for name in previously_managed.get(collection_name, []):
+                if name in existing and name not in wanted:
+                    await collection.drop_index(name)
+                    logger.info(f"Dropped stale index {collection_name}.{name}")
+        failed = False
+        for index in indexes:
+            try:
+                # create_indexes is a no-op for indexes that already exist
+                await collection.create_indexes([index])
+            except OperationFailure as e:
+                ttl = index.document.get("expireAfterSeconds")
+                if e.code == 85 and ttl is not None:
+                    # Retention was reconfigured: update the TTL in place
+                    await db.command("collMod", collection_name, index={"name": index.document["name"], "expireAfterSeconds": ttl})
+                else:
+                    # e.g. duplicate keys for a unique index; the other indexes and collections still get theirs
+                    logger.error(f"Failed to create index {collection_name}.{index.document['name']}: {e}")
+                    failed = True
+        
+        if not upgrading:
+            continue
+        if failed:
+            # Keep the old version, but remember the indexes that were created so a later upgrade can drop them
+            update[f"managed.{collection_name}"] = sorted(set(previously_managed.get(collection_name, [])) | set(wanted))
+        else:
+            update[f"managed.{collection_name}"] = wanted
+            update[f"versions.{collection_name}"] = INDEX_VERSION
+    
+    if update:
+        update["updated_at"] = datetime.now(timezone.utc)
+        await db.schema_info.update_one({"_id": "indexes"}, {"$set": update, "$unset": {"version": ""}}, upsert=True)
+        upgraded = [key.split(".", 1)[1] for key in update if key.startswith("versions.")]
+        if upgraded:
+            logger.info(f"Indexes upgraded to version {INDEX_VERSION}: {', '.join(upgraded)}")
+
+# Fields stored as ISO strings before they moved to native BSON dates
+DATETIME_FIELDS = {
+    "users": ["created_at"],
+    "profiles": ["created_at", "updated_at"],
+    "boost_commands": ["created_at"],
+}
+
+async def migrate_string_datetimes():
+    # One-time rewrite of string dates; the marker saves the collection scans on later starts
+    if await db.schema_info.find_one({"_id": "datetimes"}):
+        return
+    
+    converted = 0
+    for collection_name, fields in DATETIME_FIELDS.items():
+        collection = db[collection_name]
+        query: Dict[str, Any] = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        while True:
+            docs = await collection.find(query, {"_id": 1, **{f: 1 for f in fields}}).sort("_id", 1).limit(1000).to_list(1000)
+            if not docs:
+                break
+            updates = []
+            for doc in docs:
+                values = {}
+                for field in fields:
+                    if isinstance(doc.get(field), str):
+                        try:
+                            values[field] = as_utc(datetime.fromisoformat(doc[field]))
+                        except ValueError:
+                            logger.error(f"Unparseable {collection_name}.{field} on {doc['_id']}: {doc[field]!r}")
+                if values:
+                    updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": values}))
+            if updates:
+                await collection.bulk_write(updates, ordered=False)
+                converted += len(updates)
+            # Continue past documents that couldn't be converted
+            query = {**query, "_id": {"$gt": docs[-1]["_id"]}}
+    
+    await db.schema_info.update_one(
+        {"_id": "datetimes"},
+        {"$set": {"migrated_at": datetime.now(timezone.utc), "converted": converted}},
+        upsert=True
+    )
+    logger.info(f"Converted {converted} documents to native datetimes")
+
+def find_index_scan(plan: Dict[str, Any]) -> Optional[str]:
+    if plan.get("stage") == "IXSCAN":
+        return plan.get("indexName")
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            index_name = find_index_scan(child)
+            if index_name:
+                return index_name
+    return None
+
+def query_planner(explanation: Dict[str, Any]) -> Dict[str, Any]:
+    if "queryPlanner" in explanation:
+        return explanation["queryPlanner"]
+    # Time-series reads explain as a pipeline over the bucket collection
+    return explanation["stages"][0]["$cursor"]["queryPlanner"]
+
+async def explain_route_queries(user_id: str) -> Dict[str, Any]:
+    # Query shapes used by the routes, keyed by route
+    queries = {
+        "POST /auth/login": db.users.find({"email": ""}).limit(1),
+        "GET /profiles": db.profiles.find({"user_id": user_id}),
+        "GET /profiles/{id}": db.profiles.find({"id": "", "user_id": user_id}).limit(1),
+        "GET /telemetry/latest": db.telemetry.find({"meta.user_id": user_id}).sort("timestamp", -1).limit(1),
+        "GET /telemetry/history": db.telemetry.find({"meta.user_id": user_id}).sort("timestamp", -1).limit(100),
+        "GET /telemetry/export": db.telemetry.find({"meta.user_id": user_id}).sort([("timestamp", 1), ("id", 1)]).limit(1000),
+        "GET /telemetry/history (1m)": db.telemetry_1m.find({"user_id": user_id}).sort("timestamp", -1).limit(100),
+        "GET /telemetry/history (1h)": db.telemetry_1h.find({"user_id": user_id}).sort("timestamp", -1).limit(100),
+        "GET /boost/commands/pending": db.boost_commands.find({"user_id": user_id, "status": "pending"}),
+        "POST /boost/commands/claim": db.boost_commands.find(claimable_query(user_id, datetime.now(timezone.utc))).sort("created_at", 1).limit(1),
+        "PUT /boost/command/{id}/status": db.boost_commands.find({"id": "", "user_id": user_id}).limit(1),
+    }
+    
+    report = {}
+    for route, cursor in queries.items():
+        explanation = await cursor.explain()
+        winning_plan = query_planner(explanation)["winningPlan"]
+        # Servers using the slot-based engine nest the plan one level deeper
+        index_name = find_index_scan(winning_plan.get("queryPlan", winning_plan))
+        report[route] = {"index": index_name, "uses_index": index_name is not None}
+    return report
+
+# ========== TELEMETRY STORAGE ==========
+
+TELEMETRY_METRICS = ["cpu_usage", "ram_usage", "ram_available", "temperature", "fps", "fps_low_1", "fps_low_01"]
+TELEMETRY_ROLLUPS_ENABLED = os.environ.get('TELEMETRY_ROLLUPS_ENABLED', 'true').lower() == 'true'
+ROLLUP_INTERVAL = float(os.environ.get('ROLLUP_INTERVAL', '60'))  # seconds between rollup passes
+# Buckets are only closed this long after they end, so buffered samples can still arrive
+ROLLUP_DELAY = timedelta(minutes=2)
+# Only the worker holding this lease runs rollups; long enough to cover a backfill pass
+ROLLUP_LEASE = timedelta(seconds=max(3 * ROLLUP_INTERVAL, 600))
+
+# Rollups run in this order; each one reads the previous level
+ROLLUPS = [
+    {"name": "1m", "collection": "telemetry_1m", "source": "telemetry", "unit": "minute",
+     "bucket": timedelta(minutes=1), "reprocess": timedelta(minutes=10), "backfill_days": TELEMETRY_TTL_DAYS},
+    {"name": "1h", "collection": "telemetry_1h", "source": "telemetry_1m", "unit": "hour",
+     "bucket": timedelta(hours=1), "reprocess": timedelta(hours=1), "backfill_days": TELEMETRY_1M_TTL_DAYS},
+]
+
+def telemetry_from_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
+    doc.update(doc.pop("meta", {}))
+    return doc
+
+def as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def truncate_time(value: datetime, bucket: timedelta) -> datetime:
+    seconds = bucket.total_seconds()
+    return datetime.fromtimestamp(value.timestamp() // seconds * seconds, tz=timezone.utc)
+
+async def ensure_telemetry_collection():
+    ttl = int(TELEMETRY_TTL_DAYS * 86400)
+    cursor = await db.list_collections(filter={"name": "telemetry"})
+    infos = await cursor.to_list(None)
+    info = infos[0] if infos else None
+    
+    if info and info.get("type") != "timeseries":
+        # Pre-time-series deployments: move the old collection aside and copy it over in the background
+        try:
+            await db.telemetry.rename("telemetry_legacy")
+            logger.info("Moved telemetry to telemetry_legacy for migration")
+        except OperationFailure as e:
+            # Another worker starting at the same time moved it first
+            logger.info(f"telemetry was already moved aside: {e}")
+        info = None
+    
+    if info is None:
+        try:
+            await db.create_collection(
+                "telemetry",
+                timeseries={"timeField": "timestamp", "metaField": "meta", "granularity": "seconds"},
+                expireAfterSeconds=ttl
+            )
+        except CollectionInvalid:
+            pass  # created concurrently by another worker
+    elif info.get("options", {}).get("expireAfterSeconds") != ttl:
+        await db.command("collMod", "telemetry", expireAfterSeconds=ttl)
+
+# Held by the worker running a background migration; renewed after every batch
+MIGRATION_LEASE = timedelta(seconds=60)
+
+async def acquire_lease(name: str, owner: str, duration: timedelta) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        await db.schema_info.find_one_and_update(
+            {"_id": f"lease_{name}", "$or": [{"owner": owner}, {"expires": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires": now + duration}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The lease document exists and another worker's lease hasn't expired
+        return False
+    return True
+
+async def migrate_legacy_telemetry():
+    # Every worker starts this; only the lease holder copies, the others wait to take over
+    owner = str(uuid.uuid4())
+    migrated = 0
+    while True:
+        if not await acquire_lease("legacy_telemetry", owner, MIGRATION_LEASE):
+            await asyncio.sleep(MIGRATION_LEASE.total_seconds())
+            if not await db.list_collection_names(filter={"name": "telemetry_legacy"}):
+                return
+            continue
+        
+        docs = await db.telemetry_legacy.find({}).sort("_id", 1).limit(1000).to_list(1000)
+        if not docs:
+            break
+        legacy_ids = []
+        samples = []
+        for doc in docs:
+            legacy_id = doc.pop("_id")
+            legacy_ids.append(legacy_id)
+            doc.setdefault("id", str(legacy_id))
+            if isinstance(doc['timestamp'], str):
+                doc['timestamp'] = datetime.fromisoformat(doc['timestamp'])
+            doc["meta"] = {"user_id": doc.pop("user_id"), "agent_id": doc.pop("agent_id")}
+            samples.append(doc)
+        
+        # A batch copied before a crash, but not yet deleted from the legacy collection, isn't copied again
+        copied = await db.telemetry.find({
+            "meta.user_id": {"$in": list({s["meta"]["user_id"] for s in samples})},
+            "timestamp": {"$gte": min(s["timestamp"] for s in samples), "$lte": max(s["timestamp"] for s in samples)},
+            "id": {"$in": [s["id"] for s in samples]},
+        }, {"_id": 0, "id": 1}).to_list(None)
+        copied_ids = {c["id"] for c in copied}
+        samples = [s for s in samples if s["id"] not in copied_ids]
+        
+        if samples:
+            await db.telemetry.insert_many(samples, ordered=False)
+        await db.telemetry_legacy.delete_many({"_id": {"$in": legacy_ids}})
+        migrated += len(samples)
+    await db.telemetry_legacy.drop()
+    await db.schema_info.delete_one({"_id": "lease_legacy_telemetry", "owner": owner})
+    logger.info(f"Migrated {migrated} legacy telemetry samples")
+
+def rollup_pipeline(rollup: Dict[str, Any], start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    from_raw = rollup["source"] == "telemetry"
+    user_field, agent_field = ("$meta.user_id", "$meta.agent_id") if from_raw else ("$user_id", "$agent_id")
+    
+    group: Dict[str, Any] = {
+        "_id": {
+            "user_id": user_field,
+            "agent_id": agent_field,
+            "timestamp": {"$dateTrunc": {"date": "$timestamp", "unit": rollup["unit"]}},
+        },
+        "samples": {"$sum": 1 if from_raw else "$samples"},
+        "active_game": {"$last": "$active_game"},
+    }
+    metrics = {}
+    for metric in TELEMETRY_METRICS:
+        if from_raw:
+            value = f"${metric}"
+            group[f"{metric}_sum"] = {"$sum": value}
+            group[f"{metric}_count"] = {"$sum": {"$cond": [{"$isNumber": value}, 1, 0]}}
+            group[f"{metric}_min"] = {"$min": value}
+            group[f"{metric}_max"] = {"$max": value}
+        else:
+            group[f"{metric}_sum"] = {"$sum": f"$metrics.{metric}.sum"}
+            group[f"{metric}_count"] = {"$sum": f"$metrics.{metric}.count"}
+            group[f"{metric}_min"] = {"$min": f"$metrics.{metric}.min"}
+            group[f"{metric}_max"] = {"$max": f"$metrics.{metric}.max"}
+        metrics[metric] = {stat: f"${metric}_{stat}" for stat in ("sum", "count", "min", "max")}
+    
+    return [
+        {"$match": {"timestamp": {"$gte": start, "$lt": end}}},
+        {"$sort": {"timestamp": 1}},
+        {"$group": group},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "agent_id": "$_id.agent_id",
+            "timestamp": "$_id.timestamp",
+            "samples": 1,
+            "active_game": 1,
+            "metrics": metrics,
+        }},
+        # Re-running a window replaces its buckets, so rollups are idempotent
+        {"$merge": {
+            "into": rollup["collection"],
+            "on": ["user_id", "agent_id", "timestamp"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+async def rollup_telemetry(owner: Optional[str] = None):
+    upper = datetime.now(timezone.utc) - ROLLUP_DELAY
+    for rollup in ROLLUPS:
+        # Taken, or renewed, before every level, so a backfill doesn't outlive it
+        if owner and not await acquire_lease("rollups", owner, ROLLUP_LEASE):
+            return
+        end = truncate_time(upper, rollup["bucket"])
+        state = await db.schema_info.find_one({"_id": f"rollup_{rollup['name']}"}) or {}
+        if state.get("until"):
+            start = state["until"] - rollup["reprocess"]
+        else:
+            start = truncate_time(end - timedelta(days=rollup["backfill_days"]), rollup["bucket"])
+        
+        if start < end:
+            await db[rollup["source"]].aggregate(rollup_pipeline(rollup, start, end)).to_list(None)
+            if state.get("until"):
+                # Leaves a marker rewound by late samples meanwhile for the next pass
+                await db.schema_info.update_one(
+                    {"_id": f"rollup_{rollup['name']}", "until": state["until"]},
+                    {"$set": {"until": end}}
+                )
+            else:
+                await db.schema_info.update_one(
+                    {"_id": f"rollup_{rollup['name']}"},
+                    {"$set": {"until": end}},
+                    upsert=True
+                )
+        # Coarser rollups may only read buckets this level has already closed
+        upper = end
+
+async def rewind_rollups(oldest: datetime):
+    # Late samples (a replayed agent spool) land in buckets the rollups already closed;
+    # move each marker back so the next pass reprocesses from the oldest one
+    for rollup in ROLLUPS:
+        until = truncate_time(oldest, rollup["bucket"]) + rollup["reprocess"]
+        await db.schema_info.update_one(
+            {"_id": f"rollup_{rollup['name']}", "until": {"$gt": until}},
+            {"$set": {"until": until}}
+        )
+
+async def run_telemetry_rollups():
+    # Every worker runs this loop; the lease lets one of them do the passes
+    owner = str(uuid.uuid4())
+    while True:
+        try:
+            await rollup_telemetry(owner)
+        except Exception as e:
+            logger.error(f"Telemetry rollup failed: {e}")
+        await asyncio.sleep(ROLLUP_INTERVAL)
+
+def rollup_to_telemetry(doc: Dict[str, Any]) -> Dict[str, Any]:
+    sample = {
+        "id": f"{doc['agent_id']}:{doc['timestamp'].isoformat()}",
+        "user_id": doc["user_id"],
+        "agent_id": doc["agent_id"],
+        "active_game": doc.get("active_game"),
+        "timestamp": doc["timestamp"],
+    }
+    for metric in TELEMETRY_METRICS:
+        # Buckets rolled up before a metric existed don't have it
+        stats = doc["metrics"].get(metric)
+        sample[metric] = stats["sum"] / stats["count"] if stats and stats["count"] else None
+    if sample["fps"] is not None:
+        sample["fps"] = round(sample["fps"])
+    return sample
+
 # ========== AUTH HELPERS ==========
 
+# bcrypt releases the GIL while hashing, so a small dedicated pool keeps those tens
+# of milliseconds off the event loop without letting a login burst take every thread
+password_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('PASSWORD_HASH_WORKERS', '4')),
+    thread_name_prefix="bcrypt"
+)
+
+class TokenCache:
+    """Verified JWTs mapped to their user, valid until the token's own expiry."""
+    
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.entries = LRUCache(maxsize)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, token: str) -> Optional[str]:
+        entry = self.entries.get(token)
+        if entry is not None:
+            user_id, expires_at = entry
+            if expires_at > time.time():
+                self.hits += 1
+                return user_id
+            self.entries.pop(token)
+        self.misses += 1
+        return None
+    
+    def set(self, token: str, user_id: str, exp: float):
+        self.entries.set(token, (user_id, min(exp, time.time() + self.ttl_seconds)))
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+token_cache = TokenCache(
+    int(os.environ.get('TOKEN_CACHE_SIZE', '10000')),
+    float(os.environ.get('TOKEN_CACHE_TTL', '300'))
+)
+
 def hash_password(password: str) -> str:
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, hash_password, password)
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, verify_password, password, hashed)
+
 def create_token(user_id: str) -> str:
     payload = {"user_id": user_id, "exp": datetime.now(timezone.utc).timestamp() + 86400 * 30}
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+def verify_token(token: str) -> str:
+    user_id = token_cache.get(token)
+    if user_id:
+        return user_id
+    
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload["user_id"]
+        user_id = payload["user_id"]
     except:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    
+    token_cache.set(token, user_id, payload["exp"])
+    return user_id
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    return verify_token(credentials.credentials)
+
+async def get_stream_user(
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> str:
+    # Browsers' EventSource can't set headers, so streams also take the token as a query parameter
+    if credentials:
+        return verify_token(credentials.credentials)
+    if token:
+        return verify_token(token)
+    raise HTTPException(status_code=403, detail="Not authenticated")
 
 # ========== AUTH ROUTES ==========
 
@@ -143,8 +887,7 @@ async def register(user_data: UserCreate):
     
     user = User(username=user_data.username, email=user_data.email)
     user_dict = user.model_dump()
-    user_dict['password'] = hash_password(user_data.password)
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
+    user_dict['password'] = await hash_password_async(user_data.password)
     
     await db.users.insert_one(user_dict)
     token = create_token(user.id)
@@ -154,7 +897,7 @@ async def register(user_data: UserCreate):
 @api_router.post("/auth/login", response_model=Dict[str, Any])
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email})
-    if not user or not verify_password(credentials.password, user['password']):
+    if not user or not await verify_password_async(credentials.password, user['password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_token(user['id'])
@@ -162,36 +905,68 @@ async def login(credentials: UserLogin):
 
 # ========== PROFILE ROUTES ==========
 
+def etag_stamp(updated_at: Any) -> str:
+    if isinstance(updated_at, str):  # not yet converted by migrate_string_datetimes
+        updated_at = datetime.fromisoformat(updated_at)
+    # Milliseconds, as Mongo stores them, so a value just written stamps the same as when read back
+    updated_at = as_utc(updated_at)
+    return f"{int(updated_at.timestamp()) * 1000 + updated_at.microsecond // 1000:x}"
+
+def profile_etag(updated_at: Any) -> str:
+    return f'"{etag_stamp(updated_at)}"'
+
+def list_etag(updated_at: List[Any]) -> str:
+    # Count plus newest change: any create, update or delete alters one of them
+    newest = max((etag_stamp(v) for v in updated_at), key=lambda stamp: int(stamp, 16), default="0")
+    return f'"{len(updated_at)}-{newest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    # Weak comparison, as required for If-None-Match
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag in tags or "*" in tags
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
 @api_router.post("/profiles", response_model=GameProfile)
-async def create_profile(profile: GameProfileCreate, user_id: str = Depends(get_current_user)):
+async def create_profile(profile: GameProfileCreate, response: Response, user_id: str = Depends(get_current_user)):
     profile_obj = GameProfile(**profile.model_dump(), user_id=user_id)
-    profile_dict = profile_obj.model_dump()
-    profile_dict['created_at'] = profile_dict['created_at'].isoformat()
-    profile_dict['updated_at'] = profile_dict['updated_at'].isoformat()
-    
-    await db.profiles.insert_one(profile_dict)
+    await db.profiles.insert_one(profile_obj.model_dump())
+    response.headers["ETag"] = profile_etag(profile_obj.updated_at)
     return profile_obj
 
 @api_router.get("/profiles", response_model=List[GameProfile])
-async def get_profiles(user_id: str = Depends(get_current_user)):
-    profiles = await db.profiles.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    for p in profiles:
-        if isinstance(p['created_at'], str):
-            p['created_at'] = datetime.fromisoformat(p['created_at'])
-        if isinstance(p['updated_at'], str):
-            p['updated_at'] = datetime.fromisoformat(p['updated_at'])
-    return profiles
+async def get_profiles(request: Request, user_id: str = Depends(get_current_user)):
+    if request.headers.get("if-none-match"):
+        # Revalidate from the indexed user_id and one field before loading whole profiles
+        stamps = await db.profiles.find({"user_id": user_id}, {"_id": 0, "updated_at": 1}).to_list(1000)
+        etag = list_etag([p["updated_at"] for p in stamps])
+        if etag_matches(request, etag):
+            return not_modified(etag)
+    
+    profiles = await db.profiles.find({"user_id": user_id}, PROFILE_PROJECTION).to_list(1000)
+    return FastJSONResponse(
+        [{**PROFILE_DEFAULTS, **p} for p in profiles],
+        headers={"ETag": list_etag([p["updated_at"] for p in profiles])}
+    )
 
 @api_router.get("/profiles/{profile_id}", response_model=GameProfile)
-async def get_profile(profile_id: str, user_id: str = Depends(get_current_user)):
-    profile = await db.profiles.find_one({"id": profile_id, "user_id": user_id}, {"_id": 0})
+async def get_profile(profile_id: str, request: Request, user_id: str = Depends(get_current_user)):
+    if request.headers.get("if-none-match"):
+        current = await db.profiles.find_one({"id": profile_id, "user_id": user_id}, {"_id": 0, "updated_at": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        etag = profile_etag(current["updated_at"])
+        if etag_matches(request, etag):
+            return not_modified(etag)
+    
+    profile = await db.profiles.find_one({"id": profile_id, "user_id": user_id}, PROFILE_PROJECTION)
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
-    if isinstance(profile['created_at'], str):
-        profile['created_at'] = datetime.fromisoformat(profile['created_at'])
-    if isinstance(profile['updated_at'], str):
-        profile['updated_at'] = datetime.fromisoformat(profile['updated_at'])
-    return profile
+    return FastJSONResponse({**PROFILE_DEFAULTS, **profile}, headers={"ETag": profile_etag(profile["updated_at"])})
 
 @api_router.put("/profiles/{profile_id}", response_model=GameProfile)
 async def update_profile(profile_id: str, updates: GameProfileUpdate, user_id: str = Depends(get_current_user)):
@@ -200,16 +975,11 @@ async def update_profile(profile_id: str, updates: GameProfileUpdate, user_id: s
         raise HTTPException(status_code=404, detail="Profile not found")
     
     update_data = {k: v for k, v in updates.model_dump().items() if v is not None}
-    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_data['updated_at'] = datetime.now(timezone.utc)
     
     await db.profiles.update_one({"id": profile_id}, {"$set": update_data})
-    updated = await db.profiles.find_one({"id": profile_id}, {"_id": 0})
-    
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
-    if isinstance(updated['updated_at'], str):
-        updated['updated_at'] = datetime.fromisoformat(updated['updated_at'])
-    return updated
+    updated = await db.profiles.find_one({"id": profile_id}, PROFILE_PROJECTION)
+    return FastJSONResponse({**PROFILE_DEFAULTS, **updated}, headers={"ETag": profile_etag(updated["updated_at"])})
 
 @api_router.delete("/profiles/{profile_id}")
 async def delete_profile(profile_id: str, user_id: str = Depends(get_current_user)):
@@ -218,65 +988,709 @@ async def delete_profile(profile_id: str, user_id: str = Depends(get_current_use
         raise HTTPException(status_code=404, detail="Profile not found")
     return {"message": "Profile deleted"}
 
-# ========== TELEMETRY ROUTES ==========
+# ========== TELEMETRY WIRE FORMAT ==========
+
+# Compact alternative to JSON for agents. A frame is a header (magic, schema
+# version, sample count), the agent_id once, then one fixed-size record per
+# sample followed by the active game name when its flag is set.
+# Version 2 adds the agent's heartbeat interval right after the header;
+# version 3 adds the FPS lows after the record when their flag is set, and
+# version 4 the agent's stage timings after those.
+TELEMETRY_BINARY_TYPE = "application/x-wfps-telemetry"
+BINARY_MAGIC = b"WT"
+BINARY_VERSIONS = (1, 2, 3, 4)
+BINARY_HEADER = struct.Struct("<2sBHH")  # magic, version, sample count, agent_id length
+BINARY_HEADER_V2 = struct.Struct("<H")  # heartbeat interval in seconds, 0 when not set
+BINARY_SAMPLE_V1 = struct.Struct("<dfffBfH")  # timestamp, cpu, ram, ram available, flags, temperature, fps
+FLAG_TEMPERATURE = 1
+FLAG_FPS = 2
+FLAG_GAME = 4
+FLAG_FPS_LOWS = 8
+BINARY_FPS_LOWS = struct.Struct("<ff")  # 1% low, 0.1% low
+FLAG_TIMINGS = 16
+AGENT_STAGES = ("sampling", "process_scan", "network", "commands")
+BINARY_TIMINGS = struct.Struct("<ffff")  # milliseconds per cycle, in AGENT_STAGES order
+
+def decode_binary_telemetry(body: bytes, user_id: str, max_samples: int) -> List[Dict[str, Any]]:
+    magic, version, count, agent_len = BINARY_HEADER.unpack_from(body, 0)
+    if magic != BINARY_MAGIC:
+        raise ValueError("bad magic")
+    if version not in BINARY_VERSIONS:
+        raise ValueError(f"unsupported schema version {version}")
+    if count > max_samples:
+        raise HTTPException(status_code=413, detail=f"Frame holds {count} samples, at most {max_samples} allowed")
+    
+    offset = BINARY_HEADER.size
+    heartbeat_interval = None
+    if version >= 2:
+        heartbeat_interval = BINARY_HEADER_V2.unpack_from(body, offset)[0] or None
+        offset += BINARY_HEADER_V2.size
+    agent_id = body[offset:offset + agent_len].decode("utf-8")
+    offset += agent_len
+    
+    samples = []
+    for _ in range(count):
+        timestamp, cpu, ram, ram_available, flags, temperature, fps = BINARY_SAMPLE_V1.unpack_from(body, offset)
+        offset += BINARY_SAMPLE_V1.size
+        fps_low_1 = fps_low_01 = None
+        if flags & FLAG_FPS_LOWS and version >= 3:
+            fps_low_1, fps_low_01 = (round(v, 1) for v in BINARY_FPS_LOWS.unpack_from(body, offset))
+            offset += BINARY_FPS_LOWS.size
+        agent_timings = None
+        if flags & FLAG_TIMINGS and version >= 4:
+            values = BINARY_TIMINGS.unpack_from(body, offset)
+            agent_timings = {f"{stage}_ms": round(v, 3) for stage, v in zip(AGENT_STAGES, values)}
+            offset += BINARY_TIMINGS.size
+        active_game = None
+        if flags & FLAG_GAME:
+            game_len = body[offset]
+            active_game = body[offset + 1:offset + 1 + game_len].decode("utf-8")
+            offset += 1 + game_len
+        # Fields are already typed by the struct layout, so no model is built
+        samples.append({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "agent_id": agent_id,
+            "cpu_usage": round(cpu, 3),
+            "ram_usage": round(ram, 3),
+            "ram_available": round(ram_available, 3),
+            "temperature": round(temperature, 3) if flags & FLAG_TEMPERATURE else None,
+            "active_game": active_game,
+            "fps": fps if flags & FLAG_FPS else None,
+            "fps_low_1": fps_low_1,
+            "fps_low_01": fps_low_01,
+            "agent_timings": agent_timings,
+            "heartbeat_interval": heartbeat_interval,
+            "timestamp": datetime.fromtimestamp(timestamp, tz=timezone.utc),
+        })
+    if offset != len(body):
+        raise ValueError("trailing bytes after last sample")
+    return samples
+
+def telemetry_request_body(schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": schema},
+        TELEMETRY_BINARY_TYPE: {"schema": {"type": "string", "format": "binary"}},
+    }}}
+
+telemetry_batch_adapter = TypeAdapter(List[AgentTelemetryCreate])
+
+async def read_telemetry(request: Request, user_id: str, max_samples: int) -> List[Dict[str, Any]]:
+    # Samples come back as plain dicts shaped like AgentTelemetry
+    body = await request.body()
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    
+    if content_type == TELEMETRY_BINARY_TYPE:
+        try:
+            return decode_binary_telemetry(body, user_id, max_samples)
+        except (ValueError, struct.error, IndexError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid telemetry frame: {e}")
+    if content_type != "application/json":
+        raise HTTPException(status_code=415, detail=f"Use application/json or {TELEMETRY_BINARY_TYPE}")
+    
+    try:
+        if max_samples == 1:
+            items = [AgentTelemetryCreate.model_validate_json(body)]
+        else:
+            items = telemetry_batch_adapter.validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    if len(items) > max_samples:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {max_samples} samples")
+    return [build_telemetry(t, user_id).model_dump() for t in items]
+
+# ========== TELEMETRY STREAM ==========
 
-@api_router.post("/telemetry", response_model=AgentTelemetry)
-async def submit_telemetry(telemetry: AgentTelemetryCreate, user_id: str = Depends(get_current_user)):
-    telemetry_obj = AgentTelemetry(**telemetry.model_dump(), user_id=user_id)
-    telemetry_dict = telemetry_obj.model_dump()
-    telemetry_dict['timestamp'] = telemetry_dict['timestamp'].isoformat()
+# Frames a slow dashboard may fall behind by before the oldest are dropped
+STREAM_QUEUE_SIZE = int(os.environ.get('STREAM_QUEUE_SIZE', '16'))
+MAX_STREAM_SUBSCRIBERS = int(os.environ.get('MAX_STREAM_SUBSCRIBERS', '5000'))
+MAX_STREAMS_PER_USER = int(os.environ.get('MAX_STREAMS_PER_USER', '20'))
+# Comment lines keep proxies from closing idle streams and reveal dead connections
+STREAM_KEEPALIVE = float(os.environ.get('STREAM_KEEPALIVE', '15'))
+
+class TelemetryBroadcaster:
+    """In-process fan-out of new samples to the SSE streams of their user"""
+    
+    def __init__(self, max_subscribers: int, max_per_user: int, queue_size: int):
+        self.max_subscribers = max_subscribers
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        # user_id -> queue -> agent_id filter (None for all agents)
+        self.subscribers: Dict[str, Dict[asyncio.Queue, Optional[str]]] = {}
+        self.count = 0
+        self.dropped = 0
+    
+    def full(self, user_id: str) -> bool:
+        return self.count >= self.max_subscribers or len(self.subscribers.get(user_id, ())) >= self.max_per_user
+    
+    def subscribe(self, user_id: str, agent_id: Optional[str]) -> Optional[asyncio.Queue]:
+        if self.full(user_id):
+            return None
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(user_id, {})[queue] = agent_id
+        self.count += 1
+        return queue
     
-    await db.telemetry.insert_one(telemetry_dict)
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        streams = self.subscribers.get(user_id)
+        if streams is None or queue not in streams:
+            return
+        del streams[queue]
+        self.count -= 1
+        if not streams:
+            del self.subscribers[user_id]
+    
+    def watched(self, user_id: str) -> bool:
+        return user_id in self.subscribers
+    
+    def publish(self, sample: Dict[str, Any]):
+        streams = self.subscribers.get(sample["user_id"])
+        if not streams:
+            return
+        # Encoded once and shared by every subscriber
+        frame = sse_frame(sample)
+        for queue, agent_id in streams.items():
+            if agent_id is not None and agent_id != sample["agent_id"]:
+                continue
+            if queue.full():
+                # Slow client: it gets the newest frames, not a growing backlog
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(frame)
+
+def sse_frame(sample: Dict[str, Any]) -> bytes:
+    return b"event: telemetry\nid: " + sample["id"].encode() + b"\ndata: " + orjson.dumps(sample, option=ORJSON_OPTIONS) + b"\n\n"
+
+telemetry_broadcaster = TelemetryBroadcaster(MAX_STREAM_SUBSCRIBERS, MAX_STREAMS_PER_USER, STREAM_QUEUE_SIZE)
+
+# ========== TELEMETRY ROUTES ==========
+
+MAX_TELEMETRY_BATCH = int(os.environ.get('MAX_TELEMETRY_BATCH', '500'))
+# History ranges longer than these are served from the 1m / 1h rollups
+HISTORY_RAW_MAX_RANGE = timedelta(hours=float(os.environ.get('HISTORY_RAW_MAX_HOURS', '3')))
+HISTORY_1M_MAX_RANGE = timedelta(hours=float(os.environ.get('HISTORY_1M_MAX_HOURS', '48')))
+
+def build_telemetry(telemetry: AgentTelemetryCreate, user_id: str) -> AgentTelemetry:
+    telemetry_obj = AgentTelemetry(**telemetry.model_dump(exclude_none=True), user_id=user_id)
+    telemetry_obj.timestamp = as_utc(telemetry_obj.timestamp)
     return telemetry_obj
 
+# An agent that reports only changes is considered offline once it has missed this many heartbeats
+OFFLINE_AFTER_HEARTBEATS = 2
+
+# Agents that send every sample don't declare a heartbeat; they report at least this often
+DEFAULT_REPORT_INTERVAL = 30
+
+def is_online(last_seen: datetime, heartbeat_interval: Optional[int], now: datetime) -> bool:
+    interval = heartbeat_interval or DEFAULT_REPORT_INTERVAL
+    return (now - last_seen).total_seconds() <= interval * OFFLINE_AFTER_HEARTBEATS
+
+async def record_samples(samples: List[Dict[str, Any]]):
+    # New samples go to open streams; the newest per agent feeds the latest cache and the agent's heartbeat record
+    newest: Dict[str, Dict[str, Any]] = {}
+    for t in samples:
+        timings = t.get("agent_timings") or {}
+        # Only known stages become labels, whatever a JSON client sends
+        for stage in AGENT_STAGES:
+            if timings.get(f"{stage}_ms") is not None:
+                agent_stage_time.observe((stage,), timings[f"{stage}_ms"] / 1000)
+        if t["agent_id"] not in newest or newest[t["agent_id"]]["timestamp"] <= t["timestamp"]:
+            newest[t["agent_id"]] = t
+    
+    if telemetry_broadcaster.watched(samples[0]["user_id"]):
+        # A replayed spool batch is older than what the streams already showed; they only move forward
+        for agent_id, t in newest.items():
+            # Expired entries count too: they were shown all the same
+            cached = await latest_cache.get(t["user_id"], agent_id, stale_ok=True)
+            shown = cached["timestamp"] if cached else None
+            if isinstance(shown, str):  # from the Redis cache
+                shown = as_utc(datetime.fromisoformat(shown.replace("Z", "+00:00")))
+            for sample in samples:
+                if sample["agent_id"] == agent_id and (shown is None or sample["timestamp"] > shown):
+                    telemetry_broadcaster.publish(sample)
+                    shown = sample["timestamp"]
+    
+    now = datetime.now(timezone.utc)
+    oldest = min(t["timestamp"] for t in samples)
+    if oldest < now - ROLLUP_DELAY:
+        # Older than the closed horizon: cached aggregate buckets and rollups may be missing these
+        for user_id in {t["user_id"] for t in samples}:
+            aggregate_generations[user_id] = aggregate_generations.get(user_id, 0) + 1
+        await rewind_rollups(oldest)
+    
+    for t in newest.values():
+        await latest_cache.put(t)
+        await db.agents.update_one(
+            {"user_id": t["user_id"], "agent_id": t["agent_id"]},
+            {"$set": {"last_seen": now, "heartbeat_interval": t.get("heartbeat_interval")},
+             "$setOnInsert": {"first_seen": now}},
+            upsert=True
+        )
+
+def telemetry_to_doc(sample: Dict[str, Any]) -> Dict[str, Any]:
+    telemetry_dict = dict(sample)
+    telemetry_dict['meta'] = {"user_id": telemetry_dict.pop('user_id'), "agent_id": telemetry_dict.pop('agent_id')}
+    return telemetry_dict
+
+# Both routes accept JSON or the binary frame format, so the body is parsed by hand
+@api_router.post("/telemetry", response_model=AgentTelemetry,
+                 openapi_extra=telemetry_request_body(AgentTelemetryCreate.model_json_schema()))
+async def submit_telemetry(request: Request, user_id: str = Depends(get_current_user)):
+    samples = await read_telemetry(request, user_id, max_samples=1)
+    if len(samples) != 1:
+        raise HTTPException(status_code=400, detail="Expected exactly one sample; use /telemetry/batch")
+    sample = samples[0]
+    
+    await db.telemetry.insert_one(telemetry_to_doc(sample))
+    await record_samples(samples)
+    return sample
+
+@api_router.post("/telemetry/batch",
+                 openapi_extra=telemetry_request_body({"type": "array", "items": AgentTelemetryCreate.model_json_schema()}))
+async def submit_telemetry_batch(request: Request, user_id: str = Depends(get_current_user)):
+    samples = await read_telemetry(request, user_id, max_samples=MAX_TELEMETRY_BATCH)
+    if not samples:
+        return {"inserted": 0}
+    
+    # Unordered so one bad document doesn't stop the rest of the batch
+    await db.telemetry.insert_many([telemetry_to_doc(t) for t in samples], ordered=False)
+    
+    await record_samples(samples)
+    return {"inserted": len(samples)}
+
+@api_router.get("/agents", response_model=List[AgentStatus])
+async def get_agents(user_id: str = Depends(get_current_user)):
+    agents = await db.agents.find({"user_id": user_id}, AGENT_PROJECTION).to_list(1000)
+    now = datetime.now(timezone.utc)
+    for a in agents:
+        a['last_seen'] = as_utc(a['last_seen'])
+        a['online'] = is_online(a['last_seen'], a.get('heartbeat_interval'), now)
+    return FastJSONResponse([{**AGENT_DEFAULTS, **a} for a in agents])
+
 @api_router.get("/telemetry/latest", response_model=AgentTelemetry)
-async def get_latest_telemetry(user_id: str = Depends(get_current_user)):
-    telemetry = await db.telemetry.find_one(
-        {"user_id": user_id},
-        {"_id": 0},
-        sort=[("timestamp", -1)]
-    )
+async def get_latest_telemetry(agent_id: Optional[str] = None, user_id: str = Depends(get_current_user)):
+    cached = await latest_cache.get(user_id, agent_id)
+    if cached:
+        return FastJSONResponse(cached)
+    
+    query = {"meta.user_id": user_id}
+    if agent_id:
+        query["meta.agent_id"] = agent_id
+    telemetry = await db.telemetry.find_one(query, TELEMETRY_PROJECTION, sort=[("timestamp", -1)])
     if not telemetry:
         raise HTTPException(status_code=404, detail="No telemetry data found")
     
-    if isinstance(telemetry['timestamp'], str):
-        telemetry['timestamp'] = datetime.fromisoformat(telemetry['timestamp'])
-    return telemetry
+    telemetry = {**TELEMETRY_DEFAULTS, **telemetry_from_doc(telemetry)}
+    telemetry['timestamp'] = as_utc(telemetry['timestamp'])
+    await latest_cache.put(telemetry, keys=[(user_id, agent_id)])
+    return FastJSONResponse(telemetry)
+
+@api_router.get("/telemetry/stream")
+async def stream_telemetry(agent_id: Optional[str] = None, user_id: str = Depends(get_stream_user)):
+    # Server-sent events: each sample is pushed as it is submitted to this worker,
+    # starting with the latest known one so the dashboard renders right away
+    if telemetry_broadcaster.full(user_id):
+        raise HTTPException(status_code=503, detail="Too many telemetry streams", headers={"Retry-After": "30"})
+    latest = await latest_cache.get(user_id, agent_id)
+    
+    async def events() -> AsyncIterator[bytes]:
+        # Subscribed only once streaming starts: a client gone before then never reaches the finally below
+        queue = telemetry_broadcaster.subscribe(user_id, agent_id)
+        if queue is None:
+            return
+        try:
+            yield b"retry: 5000\n\n"
+            if latest:
+                yield sse_frame(latest)
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            # Runs when the client disconnects and Starlette cancels the stream
+            telemetry_broadcaster.unsubscribe(user_id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @api_router.get("/telemetry/history", response_model=List[AgentTelemetry])
-async def get_telemetry_history(limit: int = 100, user_id: str = Depends(get_current_user)):
-    telemetry_list = await db.telemetry.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(limit).to_list(limit)
+async def get_telemetry_history(
+    limit: int = 100,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    resolution: Optional[str] = None,  # raw, 1m or 1h; chosen from the range when omitted
+    user_id: str = Depends(get_current_user)
+):
+    start = as_utc(start) if start else None
+    end = as_utc(end) if end else None
+    if resolution is None:
+        span = (end or datetime.now(timezone.utc)) - start if start else timedelta(0)
+        if span > HISTORY_1M_MAX_RANGE:
+            resolution = "1h"
+        elif span > HISTORY_RAW_MAX_RANGE:
+            resolution = "1m"
+        else:
+            resolution = "raw"
+    if resolution not in ("raw", "1m", "1h"):
+        raise HTTPException(status_code=400, detail="resolution must be one of raw, 1m, 1h")
+    
+    time_range = {}
+    if start:
+        time_range["$gte"] = start
+    if end:
+        time_range["$lt"] = end
+    
+    if resolution == "raw":
+        query: Dict[str, Any] = {"meta.user_id": user_id}
+        if time_range:
+            query["timestamp"] = time_range
+        telemetry_list = await db.telemetry.find(query, TELEMETRY_PROJECTION).sort("timestamp", -1).limit(limit).to_list(limit)
+        return FastJSONResponse([{**TELEMETRY_DEFAULTS, **telemetry_from_doc(t)} for t in telemetry_list])
+    
+    query = {"user_id": user_id}
+    if time_range:
+        query["timestamp"] = time_range
+    rollups = await db[f"telemetry_{resolution}"].find(query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
+    return FastJSONResponse([{**TELEMETRY_DEFAULTS, **rollup_to_telemetry(r)} for r in rollups])
+
+# ========== TELEMETRY EXPORT ==========
+
+EXPORT_FIELDS = ["id", "agent_id", "timestamp", "cpu_usage", "ram_usage", "ram_available", "temperature", "active_game", "fps", "fps_low_1", "fps_low_01", "heartbeat_interval"]
+EXPORT_BATCH_SIZE = 1000
+
+def parse_export_cursor(after: str) -> Tuple[datetime, str]:
+    # Cursor is "<timestamp>,<id>" of the last row the client received
+    try:
+        timestamp, sample_id = after.rsplit(",", 1)
+        return as_utc(datetime.fromisoformat(timestamp.replace("Z", "+00:00"))), sample_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="after must be '<timestamp>,<id>' of the last exported row")
+
+def export_row(doc: Dict[str, Any]) -> Dict[str, Any]:
+    meta = doc.get("meta", {})
+    row = {field: doc.get(field) for field in EXPORT_FIELDS}
+    row["agent_id"] = meta.get("agent_id")
+    row["timestamp"] = as_utc(doc["timestamp"]).isoformat()
+    return row
+
+async def stream_export(query: Dict[str, Any], limit: Optional[int], fmt: str) -> AsyncIterator[bytes]:
+    cursor = db.telemetry.find(query, {"_id": 0}, allow_disk_use=True).sort([("timestamp", ASCENDING), ("id", ASCENDING)])
+    if limit:
+        cursor = cursor.limit(limit)
+    cursor = cursor.batch_size(EXPORT_BATCH_SIZE)
     
-    for t in telemetry_list:
-        if isinstance(t['timestamp'], str):
-            t['timestamp'] = datetime.fromisoformat(t['timestamp'])
-    return telemetry_list
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS) if fmt == "csv" else None
+    if writer:
+        writer.writeheader()
+    
+    rows = 0
+    async for doc in cursor:
+        row = export_row(doc)
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row))
+            buffer.write("\n")
+        rows += 1
+        # Flush one chunk per driver batch so memory stays flat regardless of range size
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+@api_router.get("/telemetry/export")
+async def export_telemetry(
+    format: str = "ndjson",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    agent_id: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    
+    query: Dict[str, Any] = {"meta.user_id": user_id}
+    if agent_id:
+        query["meta.agent_id"] = agent_id
+    time_range = {}
+    if start:
+        time_range["$gte"] = as_utc(start)
+    if end:
+        time_range["$lt"] = as_utc(end)
+    if time_range:
+        query["timestamp"] = time_range
+    if after:
+        # Keyset pagination: resume strictly after (timestamp, id) of the last row received
+        after_timestamp, after_id = parse_export_cursor(after)
+        query["$or"] = [
+            {"timestamp": {"$gt": after_timestamp}},
+            {"timestamp": after_timestamp, "id": {"$gt": after_id}},
+        ]
+    
+    if format == "csv":
+        media_type = "text/csv"
+        headers = {"Content-Disposition": 'attachment; filename="telemetry.csv"'}
+    else:
+        media_type = "application/x-ndjson"
+        headers = {}
+    return StreamingResponse(stream_export(query, limit, format), media_type=media_type, headers=headers)
+
+# ========== TELEMETRY AGGREGATION ==========
+
+MAX_AGGREGATE_BUCKETS = int(os.environ.get('MAX_AGGREGATE_BUCKETS', '2000'))
+# Closed buckets only change when late samples arrive, so their results are kept until evicted
+aggregate_cache = LRUCache(int(os.environ.get('AGGREGATE_CACHE_SIZE', '100000')))
+# Bumped per user when late samples arrive; older cache keys are then never read again and age out
+aggregate_generations: Dict[str, int] = {}
+
+WINDOW_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_window(window: str) -> timedelta:
+    amount, suffix = window[:-1], window[-1:]
+    if suffix not in WINDOW_SECONDS or not amount.isdigit() or int(amount) <= 0:
+        raise HTTPException(status_code=400, detail="window must look like 30s, 1m, 5m, 1h or 1d")
+    return timedelta(seconds=int(amount) * WINDOW_SECONDS[suffix])
+
+def bucket_start_expression(step: timedelta) -> Dict[str, Any]:
+    # Epoch-aligned like truncate_time(); $dateTrunc with binSize aligns to 2000-01-01
+    # instead, which disagrees for windows that don't divide 946684800 seconds (7m, 5h, 7d, ...)
+    step_ms = int(step.total_seconds() * 1000)
+    return {"$subtract": ["$timestamp", {"$mod": [{"$toLong": "$timestamp"}, step_ms]}]}
+
+def aggregate_pipeline(match: Dict[str, Any], step: timedelta, metrics: List[str]) -> List[Dict[str, Any]]:
+    group: Dict[str, Any] = {
+        "_id": bucket_start_expression(step),
+        "samples": {"$sum": 1},
+        "last_sample": {"$max": "$timestamp"},
+        "heartbeat_interval": {"$max": "$heartbeat_interval"},
+    }
+    for metric in metrics:
+        value = f"${metric}"
+        group[f"{metric}_avg"] = {"$avg": value}
+        group[f"{metric}_min"] = {"$min": value}
+        group[f"{metric}_max"] = {"$max": value}
+        group[f"{metric}_p95"] = {"$percentile": {"input": value, "p": [0.95], "method": "approximate"}}
+    return [{"$match": match}, {"$group": group}, {"$sort": {"_id": 1}}]
+
+def aggregate_row_to_bucket(row: Dict[str, Any], metrics: List[str]) -> Dict[str, Any]:
+    bucket: Dict[str, Any] = {
+        "timestamp": row["_id"],
+        "samples": row["samples"],
+        "status": "reported",
+        "last_sample": row["last_sample"],
+        "heartbeat_interval": row.get("heartbeat_interval"),
+    }
+    for metric in metrics:
+        p95 = row[f"{metric}_p95"]
+        bucket[metric] = {
+            "avg": row[f"{metric}_avg"],
+            "min": row[f"{metric}_min"],
+            "max": row[f"{metric}_max"],
+            "p95": p95[0] if p95 else None,
+        }
+    return bucket
+
+async def aggregate_buckets(match: Dict[str, Any], start: datetime, end: datetime,
+                            step: timedelta, metrics: List[str]) -> Dict[datetime, Dict[str, Any]]:
+    query = dict(match, timestamp={"$gte": start, "$lt": end})
+    rows = await db.telemetry.aggregate(aggregate_pipeline(query, step, metrics)).to_list(None)
+    return {as_utc(row["_id"]): aggregate_row_to_bucket(row, metrics) for row in rows}
+
+def fill_buckets(buckets: Dict[datetime, Optional[Dict[str, Any]]], start: datetime, end: datetime,
+                 step: timedelta, metrics: List[str], now: datetime) -> List[Dict[str, Any]]:
+    # Agents in delta mode skip samples while nothing changes, so an empty window
+    # within the heartbeat of the last sample means "unchanged", not "no data"
+    filled = []
+    previous = None
+    bucket_start = start
+    while bucket_start < min(end, now):
+        bucket = buckets.get(bucket_start)
+        if bucket is not None:
+            filled.append(bucket)
+            previous = bucket
+        elif previous is not None:
+            if is_online(previous["last_sample"], previous["heartbeat_interval"], bucket_start):
+                gap = {m: previous[m] for m in metrics}
+                gap.update(timestamp=bucket_start, samples=0, status="unchanged",
+                           last_sample=previous["last_sample"], heartbeat_interval=previous["heartbeat_interval"])
+                filled.append(gap)
+            else:
+                filled.append({"timestamp": bucket_start, "samples": 0, "status": "offline"})
+        bucket_start += step
+    return filled
+
+@api_router.get("/telemetry/aggregate")
+async def get_telemetry_aggregate(
+    window: str = "1m",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    metrics: str = "cpu_usage,ram_usage,fps",
+    agent_id: Optional[str] = None,
+    fill: bool = False,
+    user_id: str = Depends(get_current_user)
+):
+    step = parse_window(window)
+    metric_list = [m.strip() for m in metrics.split(",") if m.strip()]
+    unknown = [m for m in metric_list if m not in TELEMETRY_METRICS]
+    if not metric_list or unknown:
+        raise HTTPException(status_code=400, detail=f"metrics must be a subset of {', '.join(TELEMETRY_METRICS)}")
+    
+    now = datetime.now(timezone.utc)
+    end = as_utc(end) if end else now
+    start = truncate_time(as_utc(start) if start else end - timedelta(hours=1), step)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="from must be before to")
+    if (end - start) / step > MAX_AGGREGATE_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Range spans more than {MAX_AGGREGATE_BUCKETS} windows")
+    
+    match: Dict[str, Any] = {"meta.user_id": user_id}
+    if agent_id:
+        match["meta.agent_id"] = agent_id
+    
+    # Buckets that ended before late samples stop arriving are closed and cacheable
+    closed_end = min(truncate_time(now - ROLLUP_DELAY, step), truncate_time(end, step))
+    cache_prefix = (user_id, aggregate_generations.get(user_id, 0), agent_id, window, tuple(metric_list))
+    buckets: Dict[datetime, Optional[Dict[str, Any]]] = {}
+    missing = []
+    bucket_start = start
+    while bucket_start < closed_end:
+        key = cache_prefix + (bucket_start,)
+        if key in aggregate_cache:
+            buckets[bucket_start] = aggregate_cache.get(key)
+        else:
+            missing.append(bucket_start)
+        bucket_start += step
+    
+    if missing:
+        # One query covers every uncached closed bucket; empty ones are cached too
+        fetched = await aggregate_buckets(match, missing[0], missing[-1] + step, step, metric_list)
+        for bucket_start in missing:
+            buckets[bucket_start] = fetched.get(bucket_start)
+            aggregate_cache.set(cache_prefix + (bucket_start,), buckets[bucket_start])
+    
+    if closed_end < end:
+        buckets.update(await aggregate_buckets(match, max(start, closed_end), end, step, metric_list))
+    
+    if fill:
+        result = fill_buckets(buckets, start, end, step, metric_list, now)
+    else:
+        result = [buckets[t] for t in sorted(buckets) if buckets[t] is not None]
+    return FastJSONResponse({
+        "window": window,
+        "from": start,
+        "to": end,
+        "metrics": metric_list,
+        "buckets": result,
+    })
+
+# ========== COMMAND NOTIFICATION ==========
+
+# Long-poll requests are capped so proxies don't cut them off
+COMMAND_WAIT_MAX = float(os.environ.get('COMMAND_WAIT_MAX', '30'))
+# Waiters re-check Mongo at this interval in case the command was created by another worker
+COMMAND_WAIT_RECHECK = float(os.environ.get('COMMAND_WAIT_RECHECK', '10'))
+# A claimed command not reported back within this long is offered to agents again
+COMMAND_CLAIM_LEASE = timedelta(seconds=float(os.environ.get('COMMAND_CLAIM_LEASE', '300')))
+
+command_waiters: Dict[str, Set[asyncio.Event]] = {}
+
+def notify_command_waiters(user_id: str):
+    for event in command_waiters.get(user_id, ()):
+        event.set()
 
 # ========== BOOST COMMAND ROUTES ==========
 
 @api_router.post("/boost/command", response_model=BoostCommand)
 async def create_boost_command(command: BoostCommandCreate, user_id: str = Depends(get_current_user)):
     command_obj = BoostCommand(**command.model_dump(), user_id=user_id)
-    command_dict = command_obj.model_dump()
-    command_dict['created_at'] = command_dict['created_at'].isoformat()
-    
-    await db.boost_commands.insert_one(command_dict)
+    await db.boost_commands.insert_one(command_obj.model_dump())
+    notify_command_waiters(user_id)
     return command_obj
 
-@api_router.get("/boost/commands/pending", response_model=List[BoostCommand])
-async def get_pending_commands(user_id: str = Depends(get_current_user)):
+async def fetch_pending_commands(user_id: str) -> List[Dict[str, Any]]:
     commands = await db.boost_commands.find(
         {"user_id": user_id, "status": "pending"},
-        {"_id": 0}
+        COMMAND_PROJECTION
     ).to_list(100)
+    return [{**COMMAND_DEFAULTS, **c} for c in commands]
+
+def claimable_query(user_id: str, now: datetime) -> Dict[str, Any]:
+    # Pending commands, plus claimed ones whose agent never reported back (crashed, or the response was lost)
+    return {"user_id": user_id, "$or": [
+        {"status": "pending"},
+        {"status": "executing", "claimed_at": {"$lt": now - COMMAND_CLAIM_LEASE}},
+    ]}
+
+async def claim_pending_commands(user_id: str, agent_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+    # Each find_one_and_update atomically moves one command out of "pending",
+    # so two agents on the same account can never both receive it
+    claimed = []
+    for _ in range(limit):
+        now = datetime.now(timezone.utc)
+        claim = {"status": "executing", "agent_id": agent_id, "claimed_at": now}
+        # The claimed fields are known, so the document from before the update is enough
+        # (the in-memory stand-in used by the benchmarks can't return it after the update)
+        command = await db.boost_commands.find_one_and_update(
+            claimable_query(user_id, now),
+            {"$set": claim},
+            projection=COMMAND_PROJECTION,
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.BEFORE
+        )
+        if not command:
+            break
+        claimed.append({**COMMAND_DEFAULTS, **command, **claim})
+    return claimed
+
+@api_router.get("/boost/commands/pending", response_model=List[BoostCommand])
+async def get_pending_commands(user_id: str = Depends(get_current_user)):
+    return FastJSONResponse(await fetch_pending_commands(user_id))
+
+@api_router.post("/boost/commands/claim", response_model=List[BoostCommand])
+async def claim_commands(claim: BoostCommandClaim, user_id: str = Depends(get_current_user)):
+    return FastJSONResponse(await claim_pending_commands(user_id, claim.agent_id, claim.limit))
+
+@api_router.get("/boost/commands/wait", response_model=List[BoostCommand])
+async def wait_for_commands(timeout: float = 25, agent_id: Optional[str] = None, user_id: str = Depends(get_current_user)):
+    # Long-poll: hold the request until a pending command exists or the timeout runs out.
+    # With agent_id the returned commands are claimed for that agent, as with /boost/commands/claim
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max(0.0, min(timeout, COMMAND_WAIT_MAX))
     
-    for c in commands:
-        if isinstance(c['created_at'], str):
-            c['created_at'] = datetime.fromisoformat(c['created_at'])
-    return commands
+    # Register before the first query so a command created in between still wakes us
+    event = asyncio.Event()
+    command_waiters.setdefault(user_id, set()).add(event)
+    try:
+        while True:
+            if agent_id:
+                commands = await claim_pending_commands(user_id, agent_id)
+            else:
+                commands = await fetch_pending_commands(user_id)
+            remaining = deadline - loop.time()
+            if commands or remaining <= 0:
+                return FastJSONResponse(commands)
+            
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, COMMAND_WAIT_RECHECK))
+            except asyncio.TimeoutError:
+                pass
+            event.clear()
+    finally:
+        waiters = command_waiters.get(user_id)
+        if waiters is not None:
+            waiters.discard(event)
+            if not waiters:
+                del command_waiters[user_id]
 
 @api_router.put("/boost/command/{command_id}/status")
 async def update_command_status(command_id: str, status: str, user_id: str = Depends(get_current_user)):
@@ -288,6 +1702,17 @@ async def update_command_status(command_id: str, status: str, user_id: str = Dep
         raise HTTPException(status_code=404, detail="Command not found")
     return {"message": "Command status updated"}
 
+@api_router.put("/boost/commands/status")
+async def update_command_statuses(updates: List[BoostCommandStatusUpdate], user_id: str = Depends(get_current_user)):
+    if not updates:
+        return {"matched": 0, "modified": 0}
+    
+    result = await db.boost_commands.bulk_write(
+        [UpdateOne({"id": u.id, "user_id": user_id}, {"$set": {"status": u.status}}) for u in updates],
+        ordered=False
+    )
+    return {"matched": result.matched_count, "modified": result.modified_count}
+
 # ========== SYSTEM ROUTES ==========
 
 @api_router.get("/")
@@ -298,8 +1723,131 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
 
+@api_router.get("/health/auth-cache")
+async def auth_cache_health():
+    return token_cache.stats()
+
+@api_router.get("/health/indexes")
+async def index_health(user_id: str = Depends(get_current_user)):
+    routes = await explain_route_queries(user_id)
+    return {"index_version": INDEX_VERSION, "all_indexed": all(r["uses_index"] for r in routes.values()), "routes": routes}
+
+# ========== MIDDLEWARE ==========
+
+MAX_DECOMPRESSED_BODY = int(os.environ.get('MAX_DECOMPRESSED_BODY', str(16 * 1024 * 1024)))
+
+class GzipRequestMiddleware:
+    """Transparently inflate request bodies sent with Content-Encoding: gzip."""
+    
+    def __init__(self, app, max_size: int = MAX_DECOMPRESSED_BODY):
+        self.app = app
+        self.max_size = max_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or Headers(scope=scope).get("content-encoding", "").lower() != "gzip":
+            await self.app(scope, receive, send)
+            return
+        
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(b"".join(chunks), self.max_size)
+        except zlib.error:
+            await PlainTextResponse("Invalid gzip body", status_code=400)(scope, receive, send)
+            return
+        if decompressor.unconsumed_tail:
+            await PlainTextResponse("Decompressed body too large", status_code=413)(scope, receive, send)
+            return
+        
+        headers = [(k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")]
+        headers.append((b"content-length", str(len(body)).encode()))
+        # Updated in place (not copied) so outer middleware sees the matched route afterwards
+        scope["headers"] = headers
+        body_sent = False
+        
+        async def receive_inflated():
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        
+        await self.app(scope, receive_inflated, send)
+
+class MetricsMiddleware:
+    """Record latency and body sizes of every HTTP request, labelled by route template."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start = time.perf_counter()
+        # Content-Length is read before the gzip middleware replaces it, so this is the size on the wire
+        received = int(Headers(scope=scope).get("content-length") or 0)
+        status = 500
+        sent = 0
+        
+        async def send_measured(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_measured)
+        finally:
+            # Unmatched paths share one label so scanners can't blow up the series count
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            request_latency.observe((method, path, str(status)), time.perf_counter() - start)
+            request_size.observe((method, path), received)
+            response_size.observe((method, path), sent)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Served outside /api so the ingress doesn't expose it; scraped from inside the cluster
+    lines = []
+    for histogram in (request_latency, request_size, response_size, mongo_latency, agent_stage_time):
+        lines.extend(histogram.render())
+    
+    stats = token_cache.stats()
+    lines += [
+        "# HELP wfps_auth_cache_hits_total Token verifications answered from the cache.",
+        "# TYPE wfps_auth_cache_hits_total counter",
+        f"wfps_auth_cache_hits_total {stats['hits']}",
+        "# HELP wfps_auth_cache_misses_total Token verifications that needed jwt.decode.",
+        "# TYPE wfps_auth_cache_misses_total counter",
+        f"wfps_auth_cache_misses_total {stats['misses']}",
+        "# HELP wfps_auth_cache_entries Tokens currently cached.",
+        "# TYPE wfps_auth_cache_entries gauge",
+        f"wfps_auth_cache_entries {stats['size']}",
+        "# HELP wfps_telemetry_stream_subscribers Open telemetry SSE streams.",
+        "# TYPE wfps_telemetry_stream_subscribers gauge",
+        f"wfps_telemetry_stream_subscribers {telemetry_broadcaster.count}",
+        "# HELP wfps_telemetry_stream_dropped_total Frames dropped because a stream's queue was full.",
+        "# TYPE wfps_telemetry_stream_dropped_total counter",
+        f"wfps_telemetry_stream_dropped_total {telemetry_broadcaster.dropped}",
+    ]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 app.include_router(api_router)
 
+app.add_middleware(GzipRequestMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -314,6 +1862,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+background_tasks: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def create_db_indexes():
+    # The time-series collection must exist before indexes are created on it
+    await ensure_telemetry_collection()
+    await ensure_indexes()
+    
+    background_tasks.append(asyncio.create_task(migrate_string_datetimes()))
+    if await db.list_collection_names(filter={"name": "telemetry_legacy"}):
+        background_tasks.append(asyncio.create_task(migrate_legacy_telemetry()))
+    if TELEMETRY_ROLLUPS_ENABLED:
+        background_tasks.append(asyncio.create_task(run_telemetry_rollups()))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks:
+        task.cancel()
+    password_executor.shutdown(wait=False)
     client.close()
\ No newline at end of file
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Load test: a fleet of simulated agents against one backend instance.
+
+Each simulated agent follows the real agent's pattern: it collects a sample
+every telemetry interval and posts them as binary frames, holds a
+/boost/commands/wait long-poll open for commands (claim polling every
+command interval only while that channel is down) and reports their results
+in bulk. In delta mode only samples that changed, plus a heartbeat, are
+sent; in full mode every sample is. Either way samples are batched by size
+and age, except that a heartbeat is sent right away. A simulated dashboard per user creates boost commands now and then.
+Long-poll latencies mostly measure how long the request was held open, and
+include the ones cut short when the run stops. All clients run as
+asyncio tasks in one process, talking to the FastAPI app in-process (or to
+--url), so the event-loop lag below includes both server and client work.
+
+By default the app is backed by an in-memory MongoDB stand-in
+(mongomock-motor, which must be installed); pass --mongo-url to use a
+real MongoDB. Results are written as JSON; pass --baseline with an earlier
+result to flag routes whose p95 regressed.
+
+    python benchmarks/agent_fleet.py --agents 200 --duration 30 --output fleet.json
+    python benchmarks/agent_fleet.py --agents 200 --baseline fleet.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "agent"))
+
+import wfps_agent  # noqa: E402
+
+server = None  # imported in main(), once MONGO_URL is settled
+
+
+class Recorder:
+    """Latencies per route, plus a count of failed requests"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, path: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        except asyncio.CancelledError:
+            # A long-poll still open when the run stops; it was held this long
+            self.latencies.setdefault(route, []).append((time.perf_counter() - start) * 1000)
+            raise
+        self.latencies.setdefault(route, []).append((time.perf_counter() - start) * 1000)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def sample(agent_id: str, active_game, heartbeat_interval) -> Dict:
+    return {
+        "agent_id": agent_id,
+        "cpu_usage": random.uniform(5, 95),
+        "ram_usage": random.uniform(30, 90),
+        "ram_available": random.uniform(1, 16),
+        "temperature": random.uniform(40, 85),
+        "active_game": active_game,
+        "fps": random.randint(60, 240),
+        "fps_low_1": random.uniform(30, 60),
+        "fps_low_01": random.uniform(15, 30),
+        "heartbeat_interval": heartbeat_interval,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+async def report_results(client, recorder: Recorder, headers: Dict, commands: List[Dict]):
+    if commands:
+        await recorder.request(
+            client, "PUT /boost/commands/status", "PUT", "/api/boost/commands/status",
+            json=[{"id": c["id"], "status": "completed"} for c in commands], headers=headers,
+        )
+
+
+async def listen_for_commands(client, recorder: Recorder, headers: Dict, agent_id: str, args,
+                              push: Dict, stop: asyncio.Event):
+    """The agent's push channel: back-to-back long-polls, retried after a pause when one fails"""
+    while not stop.is_set():
+        # Connected as soon as the long-poll is sent, as the backend holds it open from then on;
+        # waiting for the first one to return would claim-poll for up to --wait-timeout
+        push["connected"] = True
+        response = await recorder.request(
+            client, "GET /boost/commands/wait", "GET", "/api/boost/commands/wait",
+            params={"timeout": args.wait_timeout, "agent_id": agent_id}, headers=headers,
+        )
+        if response is None or response.status_code != 200:
+            push["connected"] = False
+            try:
+                await asyncio.wait_for(stop.wait(), wfps_agent.COMMAND_WAIT_RETRY)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await report_results(client, recorder, headers, response.json())
+
+
+async def agent_loop(client, recorder: Recorder, token: str, args, stop: asyncio.Event):
+    headers = {"Authorization": f"Bearer {token}"}
+    agent_id = f"agent_bench_{uuid.uuid4().hex[:8]}"
+    active_game = random.choice([None, "valorant.exe", "cs2.exe"])
+    delta = args.report_mode == "delta"
+    heartbeat_interval = args.heartbeat_interval if delta else None
+    max_age = wfps_agent.DELTA_FLUSH_INTERVAL if delta else wfps_agent.TELEMETRY_FLUSH_INTERVAL
+    buffer = []
+    loop = asyncio.get_running_loop()
+    last_reported = None
+    buffer_started = 0.0
+    # Spread start times like the real agent's scheduler does
+    next_telemetry = loop.time() + random.uniform(0, args.telemetry_interval)
+    next_commands = loop.time() + random.uniform(0, args.command_interval)
+
+    push = {"connected": False}
+    listener = None
+    if args.wait_timeout > 0:
+        listener = asyncio.create_task(listen_for_commands(client, recorder, headers, agent_id, args, push, stop))
+
+    try:
+        while not stop.is_set():
+            now = loop.time()
+            if now >= next_telemetry:
+                # Delta mode: unchanged samples are skipped unless the heartbeat is due
+                heartbeat = delta and last_reported is not None and now - last_reported >= args.heartbeat_interval
+                if not delta or last_reported is None or heartbeat or random.random() < args.change_probability:
+                    if not buffer:
+                        buffer_started = now
+                    buffer.append(sample(agent_id, active_game, heartbeat_interval))
+                    last_reported = now
+                if buffer and (heartbeat or len(buffer) >= args.batch or now - buffer_started >= max_age):
+                    await recorder.request(
+                        client, "POST /telemetry/batch", "POST", "/api/telemetry/batch",
+                        content=wfps_agent.encode_binary_telemetry(buffer),
+                        headers={**headers, "Content-Type": wfps_agent.TELEMETRY_BINARY_TYPE},
+                    )
+                    buffer = []
+                next_telemetry = now + wfps_agent.jittered(args.telemetry_interval)
+
+            if now >= next_commands:
+                # Claim polling is only the fallback while the push channel is down
+                if not push["connected"]:
+                    response = await recorder.request(
+                        client, "POST /boost/commands/claim", "POST", "/api/boost/commands/claim",
+                        json={"agent_id": agent_id}, headers=headers,
+                    )
+                    commands = response.json() if response is not None and response.status_code == 200 else []
+                    await report_results(client, recorder, headers, commands)
+                next_commands = now + wfps_agent.jittered(args.command_interval)
+
+            try:
+                await asyncio.wait_for(stop.wait(), max(0.0, min(next_telemetry, next_commands) - loop.time()))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if listener is not None:
+            # Don't hold the run open for the rest of a long-poll
+            listener.cancel()
+            try:
+                await listener
+            except asyncio.CancelledError:
+                pass
+
+
+async def dashboard_loop(client, recorder: Recorder, token: str, args, stop: asyncio.Event):
+    """Stands in for a user clicking boost in the web dashboard"""
+    headers = {"Authorization": f"Bearer {token}"}
+    interval = 60 / args.commands_per_minute
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), random.expovariate(1 / interval))
+            return
+        except asyncio.TimeoutError:
+            pass
+        await recorder.request(
+            client, "POST /boost/command", "POST", "/api/boost/command",
+            json={"action": random.choice(["start_boost", "stop_boost"])}, headers=headers,
+        )
+
+
+async def loop_lag_monitor(lags: List[float], stop: asyncio.Event, interval: float = 0.05):
+    """How late a periodic timer fires: time the event loop spent unable to run it"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected) * 1000)
+
+
+async def register_users(client, recorder: Recorder, count: int) -> List[str]:
+    tokens = []
+    run_id = uuid.uuid4().hex[:8]
+    for i in range(count):
+        response = await recorder.request(
+            client, "POST /auth/register", "POST", "/api/auth/register",
+            json={"username": f"bench{i}", "email": f"bench_{run_id}_{i}@example.com", "password": "bench"},
+        )
+        if response is None or response.status_code != 200:
+            raise SystemExit(f"Registering a benchmark user failed: {response.text if response is not None else 'no response'}")
+        tokens.append(response.json()["token"])
+    return tokens
+
+
+async def run(args) -> Dict:
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url.rstrip("/"), timeout=30)
+    else:
+        if args.mongo_url:
+            await server.ensure_telemetry_collection()
+            await server.ensure_indexes()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=30)
+
+    recorder = Recorder()
+    async with client:
+        users = max(1, args.agents // args.agents_per_user)
+        tokens = await register_users(client, recorder, users)
+        recorder.latencies.pop("POST /auth/register", None)  # setup, not steady state
+
+        stop = asyncio.Event()
+        lags: List[float] = []
+        tasks = [asyncio.create_task(loop_lag_monitor(lags, stop))]
+        tasks += [asyncio.create_task(agent_loop(client, recorder, tokens[i % users], args, stop))
+                  for i in range(args.agents)]
+        tasks += [asyncio.create_task(dashboard_loop(client, recorder, token, args, stop)) for token in tokens]
+
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    routes = {}
+    for route, latencies in sorted(recorder.latencies.items()):
+        routes[route] = {
+            "requests": len(latencies),
+            "errors": recorder.errors.get(route, 0),
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+        }
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "platform": f"{platform.system()} {platform.release()} / Python {platform.python_version()}",
+        "backend": args.url or ("mongodb" if args.mongo_url else "in-process, in-memory mongo"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "mongo_url", "url")},
+        "elapsed_s": round(elapsed, 2),
+        "total_rps": round(sum(len(v) for v in recorder.latencies.values()) / elapsed, 2),
+        "routes": routes,
+        "event_loop_lag_ms": {
+            "p50": round(percentile(lags, 0.50), 2),
+            "p99": round(percentile(lags, 0.99), 2),
+            "max": round(max(lags), 2),
+        } if lags else None,
+    }
+
+
+def compare(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Routes whose p95 grew by more than `tolerance` over the baseline"""
+    regressions = []
+    for route, stats in result["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if before and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {before['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms")
+    return regressions
+
+
+def main():
+    global server
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=100)
+    parser.add_argument("--agents-per-user", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of steady-state load")
+    parser.add_argument("--telemetry-interval", type=float, default=wfps_agent.TELEMETRY_INTERVAL_ACTIVE)
+    parser.add_argument("--command-interval", type=float, default=wfps_agent.COMMAND_INTERVAL_ACTIVE)
+    parser.add_argument("--batch", type=int, default=wfps_agent.TELEMETRY_BATCH_SIZE,
+                        help="samples per telemetry request, unless the buffer ages out first")
+    parser.add_argument("--report-mode", choices=["delta", "full"], default=wfps_agent.REPORT_MODE)
+    parser.add_argument("--heartbeat-interval", type=float, default=wfps_agent.HEARTBEAT_INTERVAL,
+                        help="delta mode: seconds after which an unchanged sample is sent anyway")
+    parser.add_argument("--change-probability", type=float, default=0.2,
+                        help="delta mode: share of samples that changed enough to be sent")
+    parser.add_argument("--wait-timeout", type=float, default=wfps_agent.COMMAND_WAIT_TIMEOUT,
+                        help="seconds each command long-poll is held; 0 polls /boost/commands/claim only")
+    parser.add_argument("--commands-per-minute", type=float, default=2.0, help="dashboard commands per user")
+    parser.add_argument("--mongo-url", help="real MongoDB for the in-process app (default: in-memory stand-in)")
+    parser.add_argument("--url", help="benchmark a running backend instead, e.g. http://localhost:8001")
+    parser.add_argument("--output", default="agent_fleet.json")
+    parser.add_argument("--baseline", help="earlier result to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    os.environ["MONGO_URL"] = args.mongo_url or "mongodb://localhost:27017"
+    os.environ.setdefault("DB_NAME", "wfps_bench")
+    sys.path.insert(0, os.path.join(ROOT, "backend"))
+    import server as server_module
+    server = server_module
+    if not args.url and not args.mongo_url:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("The in-memory backend needs mongomock-motor; install it or pass --mongo-url")
+        server.db = AsyncMongoMockClient()[os.environ["DB_NAME"]]
+
+    result = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{args.agents} agents for {result['elapsed_s']}s against {result['backend']}: {result['total_rps']} req/s")
+    for route, stats in result["routes"].items():
+        print(f"  {route:<28} {stats['requests']:>7} req  {stats['throughput_rps']:>8.1f}/s  "
+              f"p50 {stats['p50_ms']:7.2f}  p95 {stats['p95_ms']:7.2f}  p99 {stats['p99_ms']:7.2f} ms  "
+              f"errors {stats['errors']}")
+    if result["event_loop_lag_ms"]:
+        lag = result["event_loop_lag_ms"]
+        print(f"  event loop lag: p50 {lag['p50']:.2f}  p99 {lag['p99']:.2f}  max {lag['max']:.2f} ms")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"  REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
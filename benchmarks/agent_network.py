@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Per-cycle network time of the agent: one-off requests calls vs the pooled session.
+
+Each cycle makes the same calls the agent does (telemetry batch, command
+claim, command results). By default it runs against a local stub server that charges
+a fixed delay for every new connection, standing in for a TCP+TLS handshake;
+pass --url and --token to measure against a real backend instead.
+
+    python benchmarks/agent_network.py --cycles 50 --handshake-ms 30
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "agent"))
+import wfps_agent  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    handshake_delay = 0.0
+
+    def setup(self):
+        super().setup()
+        # Like uvicorn; otherwise Nagle + delayed ACK adds ~40 ms to every keep-alive response
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        time.sleep(self.handshake_delay)
+
+    def respond(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        body = b"[]" if self.path.endswith("/claim") else b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = respond
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server(handshake_ms: float) -> str:
+    StubHandler.handshake_delay = handshake_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/api"
+
+
+def sample(agent_id: str):
+    return {
+        "agent_id": agent_id, "cpu_usage": 12.5, "ram_usage": 48.1, "ram_available": 7.9,
+        "temperature": None, "active_game": None, "fps": None,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def cycle_unpooled(api_url: str, headers: dict, agent_id: str):
+    """The same calls with per-call requests usage: a new connection every time"""
+    requests.post(f"{api_url}/telemetry/batch", json=[sample(agent_id)], headers=headers, timeout=10)
+    requests.post(f"{api_url}/boost/commands/claim", json={"agent_id": agent_id}, headers=headers, timeout=5)
+    requests.put(f"{api_url}/boost/commands/status", json=[{"id": "bench", "status": "completed"}],
+                 headers=headers, timeout=5)
+
+
+def cycle_pooled(agent: wfps_agent.WFPSAgent):
+    agent.queue_telemetry(sample(agent.agent_id))
+    agent.flush_telemetry()
+    agent.claim_commands()
+    agent.command_results.append({"id": "bench", "status": "completed"})
+    agent.report_command_results()
+
+
+def measure(name: str, cycle, cycles: int) -> dict:
+    timings = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        cycle()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "name": name,
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=50)
+    parser.add_argument("--handshake-ms", type=float, default=30.0, help="stub server delay per new connection")
+    parser.add_argument("--url", help="real backend API URL (defaults to a local stub)")
+    parser.add_argument("--token", default="bench")
+    args = parser.parse_args()
+
+    api_url = args.url or start_stub_server(args.handshake_ms)
+    agent = wfps_agent.WFPSAgent(api_url, args.token)
+
+    results = [
+        measure("requests per call (before)", lambda: cycle_unpooled(api_url, agent.headers, agent.agent_id), args.cycles),
+        measure("pooled session (after)", lambda: cycle_pooled(agent), args.cycles),
+    ]
+
+    print(f"{args.cycles} cycles against {api_url}")
+    for r in results:
+        print(f"  {r['name']:<28} mean {r['mean_ms']:7.2f} ms   p50 {r['p50_ms']:7.2f} ms   p95 {r['p95_ms']:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Read-route cost at 1,000 rows: GET /profiles and GET /telemetry/history.
+
+Two measurements per route. "serialize" times only the work done on the
+documents once Mongo has returned them, comparing the old path (ISO strings
+parsed with fromisoformat, response models validated, then dumped with
+json) against the current one (native datetimes, projected documents
+rendered by orjson). "route" times the whole request in-process through
+the FastAPI app, including the database read.
+
+By default the app is backed by an in-memory MongoDB stand-in
+(mongomock-motor, which must be installed); pass --mongo-url to use a
+real MongoDB.
+
+    python benchmarks/read_routes.py --rows 1000 --iterations 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+
+import httpx
+from pydantic import TypeAdapter
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+server = None  # imported in main(), once MONGO_URL is settled
+
+
+def profile_doc(user_id: str, i: int, created_at: datetime) -> Dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "name": f"Profile {i}",
+        "process_names": [f"game{i}.exe", "launcher.exe"],
+        "priority_level": "high",
+        "kill_background_apps": True,
+        "clear_memory": True,
+        "background_apps_whitelist": ["discord.exe"],
+        "game_cores": [2, 3],
+        "move_heavy_processes": True,
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+
+
+def telemetry_doc(user_id: str, timestamp: datetime) -> Dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "meta": {"user_id": user_id, "agent_id": "agent_bench"},
+        "cpu_usage": random.uniform(5, 95),
+        "ram_usage": random.uniform(30, 90),
+        "ram_available": random.uniform(1, 16),
+        "temperature": random.uniform(40, 85),
+        "active_game": "valorant.exe",
+        "fps": random.randint(60, 240),
+        "fps_low_1": random.uniform(30, 60),
+        "fps_low_01": random.uniform(15, 30),
+        "agent_timings": None,
+        "heartbeat_interval": None,
+        "timestamp": timestamp,
+    }
+
+
+def serialize_validated(model, docs: List[Dict], date_fields: List[str]) -> bytes:
+    """What the routes did before: parse string dates, validate response models, dump with json"""
+    for doc in docs:
+        for field in date_fields:
+            if isinstance(doc.get(field), str):
+                doc[field] = datetime.fromisoformat(doc[field])
+    adapter = TypeAdapter(List[model])
+    content = adapter.dump_python(adapter.validate_python(docs), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def serialize_projected(defaults: Dict, docs: List[Dict]) -> bytes:
+    return server.FastJSONResponse([{**defaults, **doc} for doc in docs]).body
+
+
+def timed(fn: Callable[[], object], iterations: int) -> Dict:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {"mean_ms": statistics.mean(timings), "p50_ms": timings[len(timings) // 2]}
+
+
+async def timed_async(fn, iterations: int) -> Dict:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {"mean_ms": statistics.mean(timings), "p50_ms": timings[len(timings) // 2]}
+
+
+async def run(args) -> List[Dict]:
+    user_id = f"bench_{uuid.uuid4().hex[:8]}"
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    profiles = [profile_doc(user_id, i, now - timedelta(minutes=i)) for i in range(args.rows)]
+    samples = [telemetry_doc(user_id, now - timedelta(seconds=2 * i)) for i in range(args.rows)]
+    await server.db.profiles.insert_many([dict(p) for p in profiles])
+    await server.db.telemetry.insert_many([dict(s) for s in samples])
+
+    # Documents as the routes see them after the query, in the old and new storage formats
+    string_profiles = [{**p, "created_at": p["created_at"].isoformat(), "updated_at": p["updated_at"].isoformat()}
+                       for p in profiles]
+    flat_samples = [{**{k: v for k, v in s.items() if k != "meta"}, **s["meta"]} for s in samples]
+
+    results = [
+        {"case": "serialize /profiles (validated, before)",
+         **timed(lambda: serialize_validated(server.GameProfile, [dict(p) for p in string_profiles],
+                                             ["created_at", "updated_at"]), args.iterations)},
+        {"case": "serialize /profiles (orjson, after)",
+         **timed(lambda: serialize_projected(server.PROFILE_DEFAULTS, [dict(p) for p in profiles]), args.iterations)},
+        {"case": "serialize /telemetry/history (validated, before)",
+         **timed(lambda: serialize_validated(server.AgentTelemetry, [dict(s) for s in flat_samples], []), args.iterations)},
+        {"case": "serialize /telemetry/history (orjson, after)",
+         **timed(lambda: serialize_projected(server.TELEMETRY_DEFAULTS, [dict(s) for s in flat_samples]), args.iterations)},
+    ]
+
+    token = server.create_token(user_id)
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers, timeout=60) as client:
+        async def get(path: str, **params):
+            response = await client.get(path, params=params)
+            response.raise_for_status()
+            if len(response.json()) != args.rows:
+                raise SystemExit(f"{path} returned {len(response.json())} rows, expected {args.rows}")
+
+        results.append({"case": "route GET /profiles",
+                        **await timed_async(lambda: get("/api/profiles"), args.iterations)})
+        results.append({"case": "route GET /telemetry/history",
+                        **await timed_async(lambda: get("/api/telemetry/history", limit=args.rows, resolution="raw"),
+                                            args.iterations)})
+    return results
+
+
+def main():
+    global server
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000, help="profiles and telemetry samples to seed (at most 1000)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--mongo-url", help="real MongoDB (default: in-memory stand-in)")
+    args = parser.parse_args()
+    args.rows = min(args.rows, 1000)  # GET /profiles returns at most 1000
+
+    os.environ["MONGO_URL"] = args.mongo_url or "mongodb://localhost:27017"
+    os.environ.setdefault("DB_NAME", "wfps_bench")
+    sys.path.insert(0, os.path.join(ROOT, "backend"))
+    import server as server_module
+    server = server_module
+    if not args.mongo_url:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("The in-memory backend needs mongomock-motor; install it or pass --mongo-url")
+        server.db = AsyncMongoMockClient()[os.environ["DB_NAME"]]
+
+    results = asyncio.run(run(args))
+    print(f"{args.rows} rows, {args.iterations} iterations, "
+          f"{'mongodb' if args.mongo_url else 'in-memory mongo'}")
+    for r in results:
+        print(f"  {r['case']:<50} mean {r['mean_ms']:8.2f} ms   p50 {r['p50_ms']:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
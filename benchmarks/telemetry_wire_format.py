@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Telemetry wire formats: payload size and server-side decode + validate cost.
+
+Compares the JSON path (AgentTelemetryCreate validation, then AgentTelemetry
+construction) with the binary frame path for a few batch sizes.
+
+    python benchmarks/telemetry_wire_format.py
+"""
+
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "wfps_bench")
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.join(ROOT, "agent"))
+
+import server  # noqa: E402
+import wfps_agent  # noqa: E402
+
+
+def make_samples(count: int):
+    now = datetime.now(timezone.utc).timestamp()
+    return [{
+        "agent_id": "agent_DESKTOP-4F7K2LM_1760000000",
+        "cpu_usage": 23.4 + i % 10,
+        "ram_usage": 61.2,
+        "ram_available": 6.21,
+        "temperature": 58.5,
+        "active_game": "valorant.exe" if i % 2 else None,
+        "fps": 144 if i % 2 else None,
+        "timestamp": datetime.fromtimestamp(now + i, tz=timezone.utc).isoformat(),
+    } for i in range(count)]
+
+
+def decode_json(body: bytes):
+    items = server.telemetry_batch_adapter.validate_json(body)
+    return [server.build_telemetry(t, "user").model_dump() for t in items]
+
+
+def decode_binary(body: bytes):
+    return server.decode_binary_telemetry(body, "user", server.MAX_TELEMETRY_BATCH)
+
+
+def per_call_us(func, body: bytes) -> float:
+    timer = timeit.Timer(lambda: func(body))
+    loops, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=loops)) / loops * 1e6
+
+
+def main():
+    print(f"{'samples':>7}  {'json bytes':>10}  {'binary bytes':>12}  {'json decode':>12}  {'binary decode':>13}")
+    for count in (1, 6, 100):
+        samples = make_samples(count)
+        json_body = json.dumps(samples).encode("utf-8")
+        binary_body = wfps_agent.encode_binary_telemetry(samples)
+        assert len(decode_json(json_body)) == len(decode_binary(binary_body)) == count
+        print(f"{count:>7}  {len(json_body):>10}  {len(binary_body):>12}  "
+              f"{per_call_us(decode_json, json_body):>9.1f} us  {per_call_us(decode_binary, binary_body):>10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+import time
+
+import psutil
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "agent"))
+
+import wfps_agent  # noqa: E402
+
+pytestmark = pytest.mark.skipif(
+    (psutil.cpu_count() or 1) < 2 or not hasattr(psutil.Process, "cpu_affinity"),
+    reason="needs CPU affinity support and at least two cores",
+)
+
+
+@pytest.fixture
+def children():
+    game = subprocess.Popen(["sleep", "60"])
+    busy = subprocess.Popen([sys.executable, "-c", "while True: pass"])
+    time.sleep(0.5)  # let the busy loop show up as CPU usage
+    yield psutil.Process(game.pid), psutil.Process(busy.pid)
+    for child in (game, busy):
+        child.kill()
+        child.wait()
+
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch, children):
+    # Keep the journal and spool out of ~/.wfps
+    monkeypatch.setenv("WFPS_JOURNAL_PATH", str(tmp_path / "boost_journal.json"))
+    monkeypatch.setenv("WFPS_SPOOL_PATH", str(tmp_path / "spool.db"))
+    monkeypatch.setattr(wfps_agent, "JOURNAL_PATH", str(tmp_path / "boost_journal.json"))
+    monkeypatch.setattr(wfps_agent, "SPOOL_PATH", str(tmp_path / "spool.db"))
+
+    # The agent only sees the two children, so no other process on the machine is touched
+    def process_iter(attrs=None, ad_value=None):
+        for proc in children:
+            proc.info = {"name": proc.name()}
+            yield proc
+    monkeypatch.setattr(wfps_agent.psutil, "process_iter", process_iter)
+
+    agent = wfps_agent.WFPSAgent("http://127.0.0.1:9/api", "test")
+    yield agent
+    if agent.spool:
+        agent.spool.db.close()
+
+
+def test_game_cores_partition_and_restore(agent, children):
+    game, busy = children
+    original_game, original_busy = game.cpu_affinity(), busy.cpu_affinity()
+    cores = list(range(psutil.cpu_count()))
+    profile = {
+        "name": "affinity test",
+        "process_names": ["sleep"],
+        "priority_level": "normal",
+        "kill_background_apps": False,
+        "clear_memory": False,
+        "game_cores": [0],
+        "move_heavy_processes": True,
+    }
+
+    agent.apply_boost_profile(profile)
+
+    assert game.cpu_affinity() == [0]
+    assert busy.cpu_affinity() == cores[1:]
+    assert os.path.exists(wfps_agent.JOURNAL_PATH)
+
+    agent.stop_boost()
+
+    assert game.cpu_affinity() == original_game
+    assert busy.cpu_affinity() == original_busy
+    assert not os.path.exists(wfps_agent.JOURNAL_PATH)
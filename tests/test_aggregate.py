@@ -0,0 +1,60 @@
+import asyncio
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+# $percentile and time-series collections need a real server; the in-memory stand-ins lack them
+MONGO_URL = os.environ.get("WFPS_TEST_MONGO_URL")
+pytestmark = pytest.mark.skipif(not MONGO_URL, reason="set WFPS_TEST_MONGO_URL to a MongoDB 7+ server")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+os.environ.setdefault("MONGO_URL", MONGO_URL or "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "wfps_test")
+
+
+async def aggregate_windows(window: str, windows: int = 4):
+    import server
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(MONGO_URL, tz_aware=True)
+    db_name = f"wfps_test_{uuid.uuid4().hex[:8]}"
+    server.db = client[db_name]
+    try:
+        await server.ensure_telemetry_collection()
+        step = server.parse_window(window)
+        now = datetime.now(timezone.utc)
+        start = server.truncate_time(now - step * (windows + 2), step)
+        user_id = f"user_{uuid.uuid4().hex[:8]}"
+        await server.db.telemetry.insert_many([
+            {"id": str(uuid.uuid4()), "meta": {"user_id": user_id, "agent_id": "agent"},
+             "cpu_usage": 10.0 * (i + 1), "ram_usage": 50.0, "fps": 100, "timestamp": start + step * i + step / 2}
+            for i in range(windows)
+        ])
+
+        results = []
+        for _ in range(2):  # the second request is answered from the closed-bucket cache
+            response = await server.get_telemetry_aggregate(
+                window=window, start=start, end=start + step * windows, metrics="cpu_usage",
+                agent_id=None, fill=True, user_id=user_id,
+            )
+            results.append(json.loads(response.body))
+        return start, step, results
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+@pytest.mark.parametrize("window", ["1m", "7m", "25m", "5h"])
+def test_buckets_align_with_epoch_windows(window):
+    start, step, results = asyncio.run(aggregate_windows(window))
+    for result in results:
+        buckets = result["buckets"]
+        assert [b["status"] for b in buckets] == ["reported"] * 4
+        assert [b["samples"] for b in buckets] == [1] * 4
+        assert [b["cpu_usage"]["avg"] for b in buckets] == [10.0, 20.0, 30.0, 40.0]
+        expected = [(start + step * i).isoformat().replace("+00:00", "Z") for i in range(4)]
+        assert [b["timestamp"] for b in buckets] == expected